@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import torch
+
+from clu_tokenizer import CluTokenizer
+from export_reader import ExportedTask, ExportReader
+from file_utils import FileUtils
+from itertools import islice
+from length_batcher import LengthBatcher
+from names import Names
+from parameters import Parameters
+from token_classifier import TokenClassificationModel
+from transformers import AutoConfig, AutoTokenizer
+from typing import Iterable, Iterator, List, TextIO, Tuple
+
+# Annotates raw, pre-tokenized text with the labels of all tasks of a trained model.
+# Sentences are streamed in chunks, so memory use does not depend on the size of the input.
+# Within a chunk, sentences are tokenized together and then run in batches of similar length.
+# Each batch is encoded once and all heads are applied to it (see predict_all_tasks).
+# Dual-mode tasks are skipped because they need head positions from a parse of the sentence.
+class Annotator:
+    # the label for words that receive no tokens at all
+    no_label = "_"
+
+    def __init__(self,
+        model: TokenClassificationModel, tokenizer: AutoTokenizer, tasks: List[ExportedTask],
+        max_batch_tokens: int = 4096, chunk_size: int = Parameters.tokenizer_batch_size
+    ) -> None:
+        self.model = model
+        self.tokenizer = tokenizer
+        self.tasks = [task for task in tasks if not task.dual_mode]
+        self.max_batch_tokens = max_batch_tokens
+        self.chunk_size = chunk_size
+
+    # one sentence per line with words separated by whitespace; empty lines are skipped
+    @classmethod
+    def read_sentences(cls, file: TextIO) -> Iterator[List[str]]:
+        for line in file:
+            words = line.split()
+            if words:
+                yield words
+
+    @classmethod
+    def mk_chunks(cls, sentences: Iterable[List[str]], chunk_size: int) -> Iterator[List[List[str]]]:
+        iterator = iter(sentences)
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    # returns, for each task, the label index predicted for each sentence's first subword tokens
+    def predict_batch(self, input_ids: List[List[int]]) -> List[List[List[int]]]:
+        max_length = max(len(ids) for ids in input_ids)
+        padded_input_ids = torch.full((len(input_ids), max_length), self.tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros(len(input_ids), max_length, dtype=torch.long)
+        for index, ids in enumerate(input_ids):
+            padded_input_ids[index, :len(ids)] = torch.tensor(ids)
+            attention_mask[index, :len(ids)] = 1
+        device = self.model.device
+        all_logits = self.model.predict_all_tasks(padded_input_ids.to(device), attention_mask.to(device))
+        return [torch.argmax(all_logits[task.task_id], dim=-1).cpu().tolist() for task in self.tasks]
+
+    # yields each sentence along with its labels, one list of word labels per task
+    def annotate(self, sentences: Iterable[List[str]]) -> Iterator[Tuple[List[str], List[List[str]]]]:
+        for chunk in self.mk_chunks(sentences, self.chunk_size):
+            token_input = self.tokenizer(chunk, is_split_into_words=True, truncation=True)
+            input_ids = token_input[Names.INPUT_IDS]
+            chunk_labels: List[List[List[str]]] = [[] for _ in chunk]
+            for batch in LengthBatcher.mk_batches([len(ids) for ids in input_ids], self.max_batch_tokens):
+                task_predictions = self.predict_batch([input_ids[index] for index in batch])
+                for batch_index, sentence_index in enumerate(batch):
+                    # map predictions back to the words via the first token of each word
+                    word_ids = token_input.word_ids(batch_index=sentence_index)
+                    first_tokens = {}
+                    for token_index, word_id in enumerate(word_ids):
+                        if word_id is not None and word_id not in first_tokens:
+                            first_tokens[word_id] = token_index
+                    chunk_labels[sentence_index] = [
+                        [
+                            task.labels[predictions[batch_index][first_tokens[word_index]]] if word_index in first_tokens else self.no_label
+                            for word_index in range(len(chunk[sentence_index]))
+                        ]
+                        for task, predictions in zip(self.tasks, task_predictions)
+                    ]
+            for sentence, labels in zip(chunk, chunk_labels):
+                yield sentence, labels
+
+    # writes one word per line followed by a column of labels for each task, with an empty line after each sentence
+    def annotate_file(self, in_file_name: str, out_file_name: str) -> None:
+        self.model.to(Parameters.device)
+        with FileUtils.for_reading(in_file_name) as in_file, FileUtils.for_writing(out_file_name) as out_file:
+            out_file.write("# word\t" + "\t".join(task.task_name for task in self.tasks) + "\n")
+            for sentence, labels in self.annotate(self.read_sentences(in_file)):
+                lines = ["\t".join([word] + [task_labels[word_index] for task_labels in labels]) for word_index, word in enumerate(sentence)]
+                out_file.write("\n".join(lines) + "\n\n")
+
+    # loads a model saved by TokenClassificationModel.save_pretrained along with the tasks from its export directory
+    @classmethod
+    def load(cls, checkpoint_dir: str, export_dir: str, tokenizer: AutoTokenizer, transformer_name: str = Parameters.transformer_name) -> "Annotator":
+        tasks = ExportReader.read_tasks(export_dir)
+        config = AutoConfig.from_pretrained(checkpoint_dir)
+        model = TokenClassificationModel(config, transformer_name).add_heads(tasks)
+        model.from_pretrained(checkpoint_dir)
+        return cls(model, tokenizer, tasks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Annotate pre-tokenized text, one sentence per line, with all tasks of a model.")
+    parser.add_argument("checkpoint_dir", help="directory with the saved model, e.g., the averaged model")
+    parser.add_argument("export_dir", help="directory with the exported model, which provides the task names and labels")
+    parser.add_argument("in_file_name")
+    parser.add_argument("out_file_name")
+    args = parser.parse_args()
+    # picks the device and seeds the random number generators, as the trainers do
+    Parameters.resolve()
+
+    annotator = Annotator.load(args.checkpoint_dir, args.export_dir, CluTokenizer.get_pretrained())
+    annotator.annotate_file(args.in_file_name, args.out_file_name)
@@ -6,6 +6,8 @@ from typing import List
 
 class BasicTrainer:
     def __init__(self, tokenizer: AutoTokenizer) -> None:
+        # picks the device and seeds the random number generators before anything is built
+        Parameters.resolve()
         self.config: AutoConfig = AutoConfig.from_pretrained(Parameters.transformer_name)
         self.tokenizer: AutoTokenizer = tokenizer
 
@@ -0,0 +1,46 @@
+import inspect
+import torch
+
+from torch import Tensor
+from typing import Dict, List
+
+# Averages the parameters of several checkpoints written by TokenClassificationModel.save_pretrained
+# without building a model for any of them.  The checkpoints are streamed in one at a time and added
+# to a single float32 running sum, so that at most about two checkpoints are in memory at once.
+# The average is computed in place in the sums, which are returned.
+# Parameters that are not floating point (e.g., position ids) are taken from the first checkpoint.
+class CheckpointAverager:
+    @classmethod
+    def load_state_dict(cls, checkpoint_dir: str) -> Dict[str, Tensor]:
+        file_name = f"{checkpoint_dir}/pytorch_model.bin"
+        # newer versions of torch can memory-map the checkpoint so that tensors are only paged in when used
+        if "mmap" in inspect.signature(torch.load).parameters:
+            return torch.load(file_name, map_location="cpu", mmap=True)
+        else:
+            return torch.load(file_name, map_location="cpu")
+
+    @classmethod
+    def average(cls, checkpoint_dirs: List[str]) -> Dict[str, Tensor]:
+        print(f"Loading main checkpoint[0] {checkpoint_dirs[0]}...")
+        state_dict = cls.load_state_dict(checkpoint_dirs[0])
+        dtypes = {key: value.dtype for key, value in state_dict.items()}
+        sums = {
+            key: value.to(torch.float32, copy=True) if value.is_floating_point() else value.clone()
+            for key, value in state_dict.items()
+        }
+        del state_dict
+
+        for i in range(1, len(checkpoint_dirs)):
+            print(f"Adding satellite checkpoint[{i}] {checkpoint_dirs[i]}...")
+            state_dict = cls.load_state_dict(checkpoint_dirs[i])
+            for key, total in sums.items():
+                if dtypes[key].is_floating_point:
+                    total += state_dict[key]
+            del state_dict
+
+        print("Computing average weights...")
+        # the sums are divided in place, and to() only copies if the checkpoints were not stored as float32
+        for key, total in sums.items():
+            if dtypes[key].is_floating_point:
+                sums[key] = total.div_(len(checkpoint_dirs)).to(dtypes[key])
+        return sums
@@ -0,0 +1,113 @@
+import json
+import multiprocessing
+import os
+import torch
+
+from concurrent.futures import ProcessPoolExecutor
+from evaluator import Evaluator
+from export_reader import ExportedTask
+from names import Names
+from parameters import Parameters
+from task import LongTaskDef, Task
+from token_classifier import TokenClassificationModel
+from transformers import AutoConfig
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+# The dev accuracies of a checkpoint are kept in a file inside the checkpoint directory so that
+# they only need to be computed once.  Scores for a different set of tasks are ignored.
+class CheckpointScores:
+    @classmethod
+    def get_file_name(cls, checkpoint_dir: str) -> str:
+        return f"{checkpoint_dir}/{Names.SCORES_FILE}"
+
+    @classmethod
+    def macro_accuracy(cls, accuracies: Dict[str, float]) -> float:
+        return sum(accuracies.values()) / len(accuracies)
+
+    # only the task names matter, so the tasks of an export will do as well
+    @classmethod
+    def read(cls, checkpoint_dir: str, tasks: Sequence[Union[Task, ExportedTask]]) -> Optional[Dict[str, float]]:
+        file_name = cls.get_file_name(checkpoint_dir)
+        if not os.path.exists(file_name):
+            return None
+        with open(file_name, "r", encoding=Parameters.encoding) as file:
+            accuracies: Dict[str, float] = json.load(file)["accuracies"]
+        if set(accuracies.keys()) != {task.task_name for task in tasks}:
+            return None
+        return accuracies
+
+    @classmethod
+    def write(cls, checkpoint_dir: str, accuracies: Dict[str, float]) -> None:
+        file_name = cls.get_file_name(checkpoint_dir)
+        # write to a temporary file first so that a crash does not leave a partial score behind
+        with open(f"{file_name}.tmp", "w", encoding=Parameters.encoding) as file:
+            json.dump({"macro_accuracy": cls.macro_accuracy(accuracies), "accuracies": accuracies}, file, indent=2)
+        os.replace(f"{file_name}.tmp", file_name)
+
+# Scores checkpoints, either in this process or spread over a pool of worker processes,
+# each of which builds its own model once and then scores the checkpoints it is given.
+# The workers are spawned rather than forked, since forking a process that has already used torch
+# can deadlock in its thread pools and does not work at all once CUDA has been initialized.
+class CheckpointEvaluator:
+    # these are set in each worker process by init_worker
+    evaluator: Optional[Evaluator] = None
+    tasks: List[Task] = []
+
+    # the evaluator keeps its batched dev data, so it should be reused for all checkpoints
+    @classmethod
+    def score(cls, evaluator: Evaluator, tasks: List[Task], checkpoint_dir: str) -> Dict[str, float]:
+        evaluator.model.from_pretrained(checkpoint_dir, ignore_mismatched_sizes=True)
+        evaluator.model.summarize_heads()
+        # evaluate on validation (dev)
+        accuracies = evaluator.evaluate_tasks(tasks)
+        CheckpointScores.write(checkpoint_dir, accuracies)
+        return accuracies
+
+    # a spawned worker starts from scratch, so it gets the settings of the parent and rebuilds the tasks from their
+    # definitions, which reads their dev sets from the dataframe cache, if there is one, rather than copying them over
+    @classmethod
+    def init_worker(cls, settings: Dict[str, Any], config: AutoConfig, long_task_defs: List[LongTaskDef], num_threads: int) -> None:
+        Parameters.set_settings(settings)
+        Parameters.resolve()
+        torch.set_num_threads(num_threads)
+        tasks = [Task(long_task_def) for long_task_def in long_task_defs]
+        # the default of Evaluator was bound when evaluator was imported, which is before the settings arrived
+        cls.evaluator = Evaluator(TokenClassificationModel(config, Parameters.transformer_name).add_heads(tasks), Parameters.eval_max_batch_tokens)
+        cls.tasks = tasks
+
+    @classmethod
+    def score_in_worker(cls, checkpoint_dir: str) -> Dict[str, float]:
+        assert cls.evaluator is not None
+        return cls.score(cls.evaluator, cls.tasks, checkpoint_dir)
+
+    # returns the accuracies of each checkpoint by directory, skipping over those that have already been scored
+    @classmethod
+    def evaluate(cls, model: TokenClassificationModel, config: AutoConfig, tasks: List[Task], checkpoint_dirs: List[str], workers: int) -> Dict[str, Dict[str, float]]:
+        all_accuracies: Dict[str, Dict[str, float]] = {}
+        pending_dirs = []
+        for checkpoint_dir in checkpoint_dirs:
+            accuracies = CheckpointScores.read(checkpoint_dir, tasks)
+            if accuracies is None:
+                pending_dirs.append(checkpoint_dir)
+            else:
+                print(f"Found scores for checkpoint {checkpoint_dir}: {accuracies}")
+                all_accuracies[checkpoint_dir] = accuracies
+
+        if workers <= 1 or len(pending_dirs) <= 1:
+            evaluator = Evaluator(model, Parameters.eval_max_batch_tokens)
+            for checkpoint_dir in pending_dirs:
+                all_accuracies[checkpoint_dir] = cls.score(evaluator, tasks, checkpoint_dir)
+        else:
+            workers = min(workers, len(pending_dirs))
+            # read the dev sets once here so that the workers find them in the dataframe cache instead of tokenizing them again
+            for task in tasks:
+                task.dev_df
+            num_threads = max(1, (os.cpu_count() or 1) // workers)
+            print(f"Scoring {len(pending_dirs)} checkpoints with {workers} workers of {num_threads} threads each...")
+            with ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=cls.init_worker,
+                initargs=(Parameters.get_settings(), config, [task.long_task_def for task in tasks], num_threads)
+            ) as executor:
+                for checkpoint_dir, accuracies in zip(pending_dirs, executor.map(cls.score_in_worker, pending_dirs)):
+                    all_accuracies[checkpoint_dir] = accuracies
+        return all_accuracies
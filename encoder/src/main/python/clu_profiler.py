@@ -0,0 +1,143 @@
+import json
+import os
+import sys
+import threading
+import time
+
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Dict, Iterator, List, Optional, TextIO
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None # type: ignore
+
+# Records named spans of time and counters for the hot paths of training and export.  Each span also records
+# the peak resident set size of the process so far.  Nothing is recorded until enable() is called, and until
+# then span() returns one shared, empty context manager, so the instrumentation costs next to nothing.
+# Spans are written either as JSON lines, as they end, or as a Chrome trace (chrome://tracing or Perfetto)
+# when the profiler is closed.  Note that with CUDA, spans of GPU work only measure the time to queue it.
+# Only the process that enabled the profiler records anything.  A forked child starts out disabled, and the
+# file is flushed before forking so that the child does not inherit, and later write, a copy of its buffer.
+class CluProfiler:
+    JSON_LINES = "jsonl"
+    CHROME = "chrome"
+
+    enabled: bool = False
+    format: str = JSON_LINES
+    file: Optional[TextIO] = None
+    events: List[Dict[str, Any]] = []
+    counters: Dict[str, float] = {}
+    # named points in time (in ns) for spans that do not fit into a with block
+    marks: Dict[str, int] = {}
+    start_ns: int = 0
+    disabled_span: ContextManager[None] = nullcontext()
+
+    @classmethod
+    def get_file_name(cls, profile_dir: str, name: str, format: str = JSON_LINES) -> str:
+        extension = "jsonl" if format == cls.JSON_LINES else "json"
+        return f"{profile_dir}/{name}.{extension}"
+
+    @classmethod
+    def enable(cls, file_name: str, format: str = JSON_LINES) -> None:
+        if format not in {cls.JSON_LINES, cls.CHROME}:
+            raise Exception(f"The profile format {format} is not one of {cls.JSON_LINES} or {cls.CHROME}!")
+        cls.close()
+        os.makedirs(os.path.dirname(os.path.abspath(file_name)), exist_ok=True)
+        cls.file = open(file_name, "w", encoding="UTF-8")
+        cls.format = format
+        cls.events = []
+        cls.counters = {}
+        cls.marks = {}
+        cls.start_ns = time.perf_counter_ns()
+        cls.enabled = True
+
+    @classmethod
+    def get_peak_rss(cls) -> Optional[int]:
+        if resource is None:
+            return None
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS reports bytes and Linux reports kilobytes
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+    @classmethod
+    def add_span(cls, name: str, start_ns: int, end_ns: int, args: Dict[str, Any]) -> None:
+        if cls.file is None:
+            return
+        start_us = (start_ns - cls.start_ns) / 1000
+        duration_us = (end_ns - start_ns) / 1000
+        peak_rss = cls.get_peak_rss()
+        if cls.format == cls.JSON_LINES:
+            cls.file.write(json.dumps({"type": "span", "name": name, "start_us": start_us, "duration_us": duration_us, "peak_rss_bytes": peak_rss, "args": args}) + "\n")
+        else:
+            cls.events.append({
+                "name": name, "ph": "X", "ts": start_us, "dur": duration_us, "pid": os.getpid(), "tid": threading.get_ident(),
+                "args": dict(args, peak_rss_bytes=peak_rss)
+            })
+
+    @classmethod
+    @contextmanager
+    def enabled_span(cls, name: str, args: Dict[str, Any]) -> Iterator[None]:
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            cls.add_span(name, start_ns, time.perf_counter_ns(), args)
+
+    # use as "with CluProfiler.span(name):"
+    @classmethod
+    def span(cls, name: str, **args: Any) -> ContextManager[None]:
+        if not cls.enabled:
+            return cls.disabled_span
+        return cls.enabled_span(name, args)
+
+    @classmethod
+    def mark(cls, name: str) -> None:
+        if cls.enabled:
+            cls.marks[name] = time.perf_counter_ns()
+
+    # records a span from the time of the mark until now, if the mark was set
+    @classmethod
+    def span_since(cls, name: str, mark_name: str, **args: Any) -> None:
+        if cls.enabled and mark_name in cls.marks:
+            cls.add_span(name, cls.marks.pop(mark_name), time.perf_counter_ns(), args)
+
+    @classmethod
+    def count(cls, name: str, value: float = 1) -> None:
+        if cls.enabled:
+            cls.counters[name] = cls.counters.get(name, 0) + value
+
+    @classmethod
+    def flush(cls) -> None:
+        if cls.file is not None:
+            cls.file.flush()
+
+    # the file belongs to the parent, so the child only forgets about it
+    @classmethod
+    def disable_in_child(cls) -> None:
+        cls.enabled = False
+        cls.file = None
+        cls.events = []
+        cls.counters = {}
+        cls.marks = {}
+
+    # writes the counters, along with the spans for a Chrome trace, and stops recording
+    @classmethod
+    def close(cls) -> None:
+        if cls.file is None:
+            return
+        if cls.format == cls.JSON_LINES:
+            for name, value in cls.counters.items():
+                cls.file.write(json.dumps({"type": "counter", "name": name, "value": value}) + "\n")
+        else:
+            end_us = (time.perf_counter_ns() - cls.start_ns) / 1000
+            counter_events = [{"name": name, "ph": "C", "ts": end_us, "pid": os.getpid(), "args": {name: value}} for name, value in cls.counters.items()]
+            json.dump({"traceEvents": cls.events + counter_events, "displayTimeUnit": "ms"}, cls.file)
+        cls.file.close()
+        cls.file = None
+        cls.events = []
+        cls.enabled = False
+
+# not available on Windows, which cannot fork
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=CluProfiler.flush, after_in_child=CluProfiler.disable_in_child)
@@ -1,14 +1,12 @@
-
-from names import Names
 from parameters import Parameters
-from transformers import AutoTokenizer
+from tokenizer_registry import TokenizerRegistry
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from transformers import AutoTokenizer
 
 class CluTokenizer:
+    # the tokenizer is shared with every other caller that asks for the same name (see TokenizerRegistry)
     @classmethod
-    def get_pretrained(cls, name: str = Parameters.transformer_name) -> AutoTokenizer:
-        # add_prefix_space is needed only for the roberta tokenizer
-        add_prefix_space = "roberta" in name.lower()
-        # which transformer to use
-        print(f"Loading tokenizer named \"{name}\" with add_prefix_space={add_prefix_space}...")
-        tokenizer = AutoTokenizer.from_pretrained(name, model_input_names=[Names.INPUT_IDS, "token_type_ids", "attention_mask"], add_prefix_space=add_prefix_space)
-        return tokenizer
+    def get_pretrained(cls, name: str = Parameters.transformer_name) -> "AutoTokenizer":
+        return TokenizerRegistry.get(name)
@@ -5,16 +5,20 @@ import numpy as np
 import pandas as pd
 
 from basic_trainer import BasicTrainer
+from clu_profiler import CluProfiler
 from clu_timer import CluTimer
 from clu_tokenizer import CluTokenizer
 from datasets import Dataset
+from dev_evaluation_callback import DevEvaluationCallback
 from dual_data_collator import DualDataCollator
+from hf_trainer import HfTrainer
 from names import Names
 from parameters import Parameters
+from profiler_callback import ProfilerCallback
 from task import ShortTaskDef, Task
 from sklearn.metrics import accuracy_score
 from token_classifier import TokenClassificationModel
-from transformers import AutoTokenizer, EvalPrediction, TrainingArguments, Trainer
+from transformers import AutoTokenizer, EvalPrediction, TrainerCallback, TrainingArguments
 from typing import Dict, List
 
 class CluTrainer(BasicTrainer):
@@ -23,19 +27,36 @@ class CluTrainer(BasicTrainer):
 
     # main function for training the MTL classifier
     def train(self, tasks: List[Task]) -> None:
+        if Parameters.profile_dir is not None:
+            CluProfiler.enable(CluProfiler.get_file_name(Parameters.profile_dir, "training", Parameters.profile_format), Parameters.profile_format)
+        try:
+            self.train_model(tasks)
+        finally:
+            CluProfiler.close()
+
+    def train_model(self, tasks: List[Task]) -> None:
+        # the training data comes first, because reading it also provides the labels of the heads
+        train_df = pd.concat([task.train_df for task in tasks])
+
         # our own token classifier
         model = TokenClassificationModel(self.config, Parameters.transformer_name).add_heads(tasks)
         model.summarize_heads()
 
         # create the formal train/validation/test HF dataset
-        train_ds = Dataset.from_pandas(pd.concat([task.train_df for task in tasks]))
+        train_ds = Dataset.from_pandas(train_df)
         #validation_ds = Dataset.from_pandas(pd.concat([task.dev_df for task in tasks]))
         #test_ds = Dataset.from_pandas(pd.concat([task.test_df for task in tasks]))
 
         data_collator = DualDataCollator(self.tokenizer)
+        callbacks: List[TrainerCallback] = []
+        if Parameters.eval_on_save:
+            callbacks.append(DevEvaluationCallback(tasks))
+        if CluProfiler.enabled:
+            callbacks.append(ProfilerCallback())
 
-        # Evaluating the intermediate models in this MTL setting is tricky, so we do not do it
-        # Instead, the evaluations are handled in averager.py, where tasks are individually evaluated
+        # Evaluating the intermediate models in this MTL setting is tricky, so the HF evaluation is not used
+        # Instead, DevEvaluationCallback evaluates each task individually whenever a checkpoint is saved,
+        # and averaging_trainer.py evaluates any checkpoints that were saved without scores
         training_args = TrainingArguments(
             output_dir=Parameters.model_name,
             log_level="error",
@@ -50,14 +71,17 @@ class CluTrainer(BasicTrainer):
             no_cuda = not Parameters.use_cuda_device
         )
         
-        trainer = Trainer(
+        trainer = HfTrainer(
             model=model,
             args=training_args,
             data_collator=data_collator,
             # compute_metrics=lambda eval_pred: self.compute_metrics(eval_pred),
             train_dataset=train_ds,
             #eval_dataset=validation_ds,
-            tokenizer=self.tokenizer
+            tokenizer=self.tokenizer,
+            train_lengths=train_df[Names.INPUT_IDS].map(len).tolist(),
+            max_batch_tokens=Parameters.max_batch_tokens,
+            callbacks=callbacks
         )
         
         CluTimer.time(
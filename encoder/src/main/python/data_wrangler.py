@@ -3,12 +3,18 @@
 
 import pandas as pd
 
+from batch_aligner import BatchAligner
+from clu_profiler import CluProfiler
+from dataframe_cache import DataFrameCache
 from file_utils import FileUtils
 from names import Names
 from parameters import Parameters
 from tqdm.notebook import tqdm
-from transformers import AutoTokenizer
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Tuple, TYPE_CHECKING, Union
+from word_piece_cache import WordPieceCache
+
+if TYPE_CHECKING:
+    from transformers import AutoTokenizer
 
 # enable tqdm in pandas
 # tqdm.pandas()
@@ -91,6 +97,15 @@ class DataWrangler:
 
         return token_head_positions
                 
+    # the sorted list of the labels of the sentences
+    @classmethod
+    def mk_label_set(cls, sentences: List[Sentence]) -> List[str]:
+        labels = {label for sentence in sentences for label in sentence.labels}
+        print(f"label size = {len(labels)}")
+        sorted_labels = sorted(labels)
+        print(f"Using labels: {sorted_labels}")
+        return sorted_labels
+
     # build a sorted list of labels in the dataset            
     @classmethod
     def read_label_set(cls, filename: str) -> List[str]:
@@ -107,9 +122,31 @@ class DataWrangler:
         print(f"Using labels: {sorted_labels}")
         return sorted_labels
 
+    # reads the sentences of a file in the basic MTL format, each of which is terminated by an empty line
+    @classmethod
+    def read_sentences(cls, filename: str) -> List[Sentence]:
+        sentences: List[Sentence] = []
+        with FileUtils.for_reading(filename) as file:
+            sentence = Sentence()
+            for line in tqdm(file):
+                tokens = line.strip().split()
+                if tokens:
+                    word = tokens[0] # tokens
+                    label = tokens[1] # labels
+                    head_position = int(tokens[2]) if len(tokens) > 2 else None
+                    sentence.add_line(word, label, head_position)
+                else:
+                    sentences.append(sentence)
+                    sentence = Sentence()
+        return sentences
+
     # converts a two-column file in the basic MTL format ("word \t label") into a dataframe
     @classmethod
-    def read_dataframe(cls, filename: str, label_to_index: Dict[str, int], task_id: int, tokenizer: AutoTokenizer) -> pd.DataFrame:
+    def read_dataframe(cls, filename: str, label_to_index: Dict[str, int], task_id: int, tokenizer: "AutoTokenizer") -> pd.DataFrame:
+        return cls.mk_dataframe(cls.read_sentences(filename), label_to_index, task_id, tokenizer)
+
+    @classmethod
+    def mk_dataframe(cls, sentences: List[Sentence], label_to_index: Dict[str, int], task_id: int, tokenizer: "AutoTokenizer") -> pd.DataFrame:
         # now build the actual dataframe for this dataset
         WORDS = "words"
         STR_LABELS = "str_labels"
@@ -124,29 +161,20 @@ class DataWrangler:
             Names.TASK_IDS: []
         }
         
-        def add_sentence(sentence: Sentence) -> None:           
+        def add_sentence(sentence: Sentence, token_ids: List[int], word_ids: List[Union[int, None]], token_labels: List[int], token_head_positions: List[int]) -> None:
             data[WORDS].append(sentence.words)
             data[STR_LABELS].append(sentence.labels)
 
-            # tokenize each sentence
-            token_input = tokenizer(sentence.words, is_split_into_words=True)  
-            token_ids = token_input[Names.INPUT_IDS]
             data[Names.INPUT_IDS].append(token_ids)
 
-            word_ids = token_input.word_ids(batch_index=0)
             assert len(word_ids) == len(token_ids)
             data[WORD_IDS].append(word_ids)
             
-            # map labels to the first token in each word
-            token_labels = cls.align_labels(word_ids, sentence.labels, label_to_index)
+            # labels are mapped to the first token in each word
             assert len(token_labels) == len(token_ids)
             data[Names.LABELS].append(token_labels)
 
-            # if present, map head offsets to the first token in each word
-            if len(sentence.head_positions) > 0:
-                token_head_positions = cls.align_head_positions(word_ids, sentence.head_positions)
-            else:
-                token_head_positions = [Parameters.ignore_index] * len(word_ids)
+            # if present, head offsets are mapped to the first token in each word
             assert len(token_head_positions) == len(token_ids)            
             data[Names.HEAD_POSITIONS].append(token_head_positions)
             
@@ -158,17 +186,75 @@ class DataWrangler:
             #  print(f"word_ids = {word_ids}")
             #  print(f"head_positions = {sentence.head_positions}")
             #  print(f"token_head_positions = {token_head_positions}")                  
-        
-        with FileUtils.for_reading(filename) as file:
-            sentence = Sentence()
-            for line in tqdm(file):
-                tokens = line.strip().split()
-                if tokens:
-                    word = tokens[0] # tokens
-                    label = tokens[1] # labels
-                    head_position = int(tokens[2]) if len(tokens) > 2 else None
-                    sentence.add_line(word, label, head_position)
+
+        # tokenize the collected sentences with a single call so that the fast tokenizer can work on them in parallel
+        # and then align their labels and heads all at once (see align_labels and align_head_positions for the details)
+        # where it is known to give the same result, the word pieces of frequent words are reused (see WordPieceCache)
+        word_piece_cache = WordPieceCache.get(tokenizer, Parameters.word_piece_cache_size) if Parameters.word_piece_cache_size is not None else None
+
+        def add_sentences(batch: List[Sentence]) -> None:
+            with CluProfiler.span("tokenize", sentences=len(batch)):
+                if word_piece_cache is not None:
+                    input_ids_batch, word_ids_batch = word_piece_cache.tokenize([sentence.words for sentence in batch])
                 else:
-                    add_sentence(sentence)
-                    sentence.clear()
+                    token_input = tokenizer([sentence.words for sentence in batch], is_split_into_words=True)
+                    input_ids_batch = token_input[Names.INPUT_IDS]
+                    word_ids_batch = [token_input.word_ids(batch_index=batch_index) for batch_index in range(len(batch))]
+            with CluProfiler.span("align", sentences=len(batch)):
+                token_labels_batch, token_head_positions_batch = BatchAligner.align(
+                    word_ids_batch,
+                    [sentence.labels for sentence in batch],
+                    [sentence.head_positions for sentence in batch],
+                    label_to_index
+                )
+            CluProfiler.count("tokenized_sentences", len(batch))
+            for batch_index, sentence in enumerate(batch):
+                add_sentence(
+                    sentence, input_ids_batch[batch_index], word_ids_batch[batch_index],
+                    token_labels_batch[batch_index], token_head_positions_batch[batch_index]
+                )
+
+        for start in range(0, len(sentences), Parameters.tokenizer_batch_size):
+            add_sentences(sentences[start:start + Parameters.tokenizer_batch_size])
         return pd.DataFrame(data)
+
+    # like read_dataframe, but the result is kept in and reused from Parameters.cache_dir, if there is one
+    # the file is only read when the cache has no entry for it
+    @classmethod
+    def read_cached_dataframe(cls, filename: str, label_to_index: Dict[str, int], task_id: int, tokenizer: "AutoTokenizer") -> pd.DataFrame:
+        def read_dataframe() -> pd.DataFrame:
+            return cls.read_dataframe(filename, label_to_index, task_id, tokenizer)
+
+        if Parameters.cache_dir is None:
+            return read_dataframe()
+        cache = DataFrameCache(Parameters.cache_dir)
+        path = cache.mk_path(filename, label_to_index, task_id, tokenizer)
+        data_frame = cache.load(path)
+        if data_frame is None:
+            cache.store(path, read_dataframe())
+            # load the new entry back so that the dataframe is memory-mapped just like when it was already cached
+            data_frame = cache.load(path)
+            assert data_frame is not None
+        return data_frame
+
+    # reads a training file, whose labels are not known yet, in a single pass and returns its labels along with the dataframe
+    @classmethod
+    def read_cached_train_dataframe(cls, filename: str, task_id: int, tokenizer: "AutoTokenizer") -> Tuple[pd.DataFrame, List[str]]:
+        def read_dataframe() -> Tuple[pd.DataFrame, List[str]]:
+            sentences = cls.read_sentences(filename)
+            labels = cls.mk_label_set(sentences)
+            label_to_index = {label: index for index, label in enumerate(labels)}
+            return cls.mk_dataframe(sentences, label_to_index, task_id, tokenizer), labels
+
+        if Parameters.cache_dir is None:
+            return read_dataframe()
+        cache = DataFrameCache(Parameters.cache_dir)
+        path = cache.mk_path(filename, None, task_id, tokenizer)
+        entry = cache.load_labelled(path)
+        if entry is None:
+            cache.store(path, *read_dataframe())
+            entry = cache.load_labelled(path)
+            assert entry is not None
+        data_frame, labels = entry
+        assert labels is not None
+        return data_frame, labels
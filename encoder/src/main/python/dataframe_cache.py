@@ -0,0 +1,97 @@
+import glob
+import hashlib
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from transformers import AutoTokenizer
+
+# Keeps the dataframes produced by DataWrangler.read_dataframe on disk as Arrow files so that
+# later runs can load them instead of reading, labelling and tokenizing the corpus again.
+# An entry is keyed by everything that goes into the dataframe: the content of the input file,
+# the tokenizer and its version, the label map, and the task id.  Each (file, tokenizer, task)
+# combination has a single slot on disk, so a new entry replaces any stale one for the same slot.
+# The entries of training files are made without a label map, because their labels are collected
+# from the same file and are stored in the entry instead, in a slot of their own.
+class DataFrameCache:
+    # change this whenever the layout of the cached dataframes changes
+    version = 1
+    suffix = ".arrow"
+
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = cache_dir
+
+    @classmethod
+    def hash_file(cls, filename: str) -> str:
+        hash = hashlib.sha256()
+        with open(filename, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                hash.update(block)
+        return hash.hexdigest()
+
+    @classmethod
+    def hash_tokenizer(cls, tokenizer: "AutoTokenizer") -> str:
+        import transformers
+
+        hash = hashlib.sha256()
+        hash.update(f"{type(tokenizer).__name__} {tokenizer.name_or_path} {transformers.__version__}".encode())
+        # the complete definition of a fast tokenizer, which covers vocabulary, normalization, and special tokens
+        if tokenizer.is_fast:
+            hash.update(tokenizer.backend_tokenizer.to_str().encode())
+        return hash.hexdigest()
+
+    @classmethod
+    def hash_strings(cls, *strings: str) -> str:
+        return hashlib.sha256("\n".join(strings).encode()).hexdigest()
+
+    # label_to_index is None for the entries that store their own labels
+    def mk_path(self, filename: str, label_to_index: Optional[Dict[str, int]], task_id: int, tokenizer: "AutoTokenizer") -> str:
+        labelled = label_to_index is None
+        slot = self.hash_strings(os.path.abspath(filename), str(task_id), tokenizer.name_or_path, str(labelled))[:16]
+        key = self.hash_strings(
+            str(self.version),
+            self.hash_file(filename),
+            self.hash_tokenizer(tokenizer),
+            json.dumps(sorted(label_to_index.items()) if label_to_index is not None else None),
+            str(task_id)
+        )[:32]
+        return f"{self.cache_dir}/{slot}-{key}{self.suffix}"
+
+    def load(self, path: str) -> Optional[pd.DataFrame]:
+        entry = self.load_labelled(path)
+        return entry[0] if entry is not None else None
+
+    # the dataframe along with the labels that were stored with it, if any
+    def load_labelled(self, path: str) -> Optional[Tuple[pd.DataFrame, Optional[List[str]]]]:
+        if not os.path.exists(path):
+            return None
+        print(f"Loading cached dataframe from {path}...")
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+        metadata = table.schema.metadata or {}
+        labels = json.loads(metadata[b"labels"]) if b"labels" in metadata else None
+        # the columns stay backed by the memory-mapped Arrow buffers rather than being copied onto the heap
+        # tolist() on them still gives the plain lists (including the None word ids) that read_dataframe produces
+        return table.to_pandas(types_mapper=pd.ArrowDtype), labels
+
+    def store(self, path: str, data_frame: pd.DataFrame, labels: Optional[List[str]] = None) -> None:
+        print(f"Caching dataframe in {path}...")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        table = pa.Table.from_pandas(data_frame, preserve_index=False)
+        if labels is not None:
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"labels": json.dumps(labels).encode()})
+        # write to a temporary file first so that an interrupted run does not leave a broken entry behind
+        temp_path = f"{path}.tmp"
+        with pa.OSFile(temp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(temp_path, path)
+        # other entries in the same slot were made from previous versions of the inputs and are stale now
+        slot = os.path.basename(path).split("-")[0]
+        for stale_path in glob.glob(f"{self.cache_dir}/{slot}-*{self.suffix}"):
+            if stale_path != path:
+                os.remove(stale_path)
@@ -0,0 +1,31 @@
+from checkpoint_evaluator import CheckpointScores
+from evaluator import Evaluator
+from task import Task
+from token_classifier import TokenClassificationModel
+from transformers import TrainerCallback, TrainerControl, TrainerState, TrainingArguments
+from transformers.trainer_utils import PREFIX_CHECKPOINT_DIR
+from typing import Any, List, Optional
+
+# Scores the model on the dev partition of each task right after the trainer saves a checkpoint
+# and writes the scores into the checkpoint directory, where AveragingTrainer will find them
+# instead of reloading and evaluating the checkpoint itself.
+class DevEvaluationCallback(TrainerCallback):
+    def __init__(self, tasks: List[Task]) -> None:
+        self.tasks = tasks
+        # made with the first model that is scored so that its dev batches are reused by later saves
+        self.evaluator: Optional[Evaluator] = None
+
+    def on_save(self, args: TrainingArguments, state: TrainerState, control: TrainerControl, model: Optional[TokenClassificationModel] = None, **kwargs: Any) -> None:
+        if model is None or not state.is_world_process_zero:
+            return
+        checkpoint_dir = f"{args.output_dir}/{PREFIX_CHECKPOINT_DIR}-{state.global_step}"
+        print(f"Evaluating checkpoint {checkpoint_dir} on the dev partitions...")
+        self.evaluator = Evaluator(model) if self.evaluator is None else self.evaluator.with_model(model)
+        try:
+            accuracies = self.evaluator.evaluate_tasks(self.tasks)
+        finally:
+            # the evaluator switches the model into inference mode, so switch it back for training
+            model.train()
+            model.training_mode = True
+        print(f"Macro accuracy for checkpoint {checkpoint_dir}: {CheckpointScores.macro_accuracy(accuracies)}")
+        CheckpointScores.write(checkpoint_dir, accuracies)
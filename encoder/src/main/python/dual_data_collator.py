@@ -1,58 +1,69 @@
 import torch
 
+from clu_profiler import CluProfiler
+from itertools import chain
 from names import Names
+from torch import Tensor
 from transformers import AutoTokenizer, DataCollatorForTokenClassification
+from transformers.utils import PaddingStrategy
 from typing import Any, Dict, List
 
-# A custom data collator that creates correct batches for all tasks by including the Names.HEAD_POSITIONS column as well
+# A custom data collator that creates correct batches for all tasks by including the Names.HEAD_POSITIONS column as well.
+# Rather than going through tokenizer.pad, each field is copied into a single preallocated int64 tensor.
 class DualDataCollator(DataCollatorForTokenClassification):
+    ATTENTION_MASK = "attention_mask"
+    TOKEN_TYPE_IDS = "token_type_ids"
+
     def __init__(self, tokenizer: AutoTokenizer) -> None:
         super().__init__(tokenizer)
 
-    def make_head_features(self, features: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        result = [{Names.INPUT_IDS: feature[Names.HEAD_POSITIONS]} for feature in features]
-        return result
-        # return [{Names.INPUT_IDS: feature[Names.HEAD_POSITIONS]} for feature in features]
+    def get_sequence_length(self, lengths: List[int]) -> int:
+        if self.padding in {"max_length", PaddingStrategy.MAX_LENGTH} and self.max_length is not None:
+            sequence_length = self.max_length
+        else:
+            sequence_length = max(lengths)
+        if self.pad_to_multiple_of is not None and sequence_length % self.pad_to_multiple_of != 0:
+            sequence_length = (sequence_length // self.pad_to_multiple_of + 1) * self.pad_to_multiple_of
+        return sequence_length
+
+    # the positions in a [batch, sequence_length] tensor that are occupied by the unpadded values, in row-major order
+    def get_value_mask(self, lengths: Tensor, sequence_length: int) -> Tensor:
+        positions = torch.arange(sequence_length).unsqueeze(0)
+        if self.tokenizer.padding_side == "right":
+            return positions < lengths.unsqueeze(1)
+        else:
+            return positions >= (sequence_length - lengths).unsqueeze(1)
+
+    def pad(self, sequences: List[List[int]], pad_value: int, value_mask: Tensor) -> Tensor:
+        padded = torch.full(value_mask.shape, pad_value, dtype=torch.int64)
+        padded[value_mask] = torch.tensor(list(chain.from_iterable(sequences)), dtype=torch.int64)
+        return padded
 
     def torch_call(self, features: List[Dict[str, Any]]) -> Dict[str, Any]:
+        with CluProfiler.span("collate", batch_size=len(features)):
+            return self.collate(features)
+
+    def collate(self, features: List[Dict[str, Any]]) -> Dict[str, Any]:
         label_name: str = "label" if "label" in features[0].keys() else Names.LABELS
-        labels = [feature[label_name] for feature in features] if label_name in features[0].keys() else None
-
-        batch = self.tokenizer.pad(
-            features,
-            padding=self.padding,
-            max_length=self.max_length,
-            pad_to_multiple_of=self.pad_to_multiple_of,
-            # Conversion to tensors will fail if we have labels as they are not of the same length yet.
-            return_tensors="pt" if labels is None else None
-        )
-        # HF does not batch head_positions, so we have to fake it by masquerading them as input_ids
-        heads = self.make_head_features(features)
-        batch_heads = self.tokenizer.pad(
-            heads,
-            padding=self.padding,
-            max_length=self.max_length,
-            pad_to_multiple_of=self.pad_to_multiple_of,
-            # Conversion to tensors will fail if we have labels as they are not of the same length yet.
-            return_tensors="pt" if labels is None else None
-        )
-        #print(f"batched head positions: {batch_heads[Names.INPUT_IDS]}")
-        batch[Names.HEAD_POSITIONS] = batch_heads[Names.INPUT_IDS]
-
-        if labels is None:
-            return batch
-
-        sequence_length = torch.tensor(batch[Names.INPUT_IDS]).shape[1]
-        padding_side = self.tokenizer.padding_side
-        if padding_side == "right":
-            batch[label_name] = [
-                list(label) + [self.label_pad_token_id] * (sequence_length - len(label)) for label in labels
-            ]
-        else:
-            batch[label_name] = [
-                [self.label_pad_token_id] * (sequence_length - len(label)) + list(label) for label in labels
-            ]
+        lengths = [len(feature[Names.INPUT_IDS]) for feature in features]
+        sequence_length = self.get_sequence_length(lengths)
+        value_mask = self.get_value_mask(torch.tensor(lengths), sequence_length)
+        pad_token_id = self.tokenizer.pad_token_id
 
-        batch = {k: torch.tensor(v, dtype=torch.int64) for k, v in batch.items()}
+        batch: Dict[str, Any] = {}
+        batch[Names.INPUT_IDS] = self.pad([feature[Names.INPUT_IDS] for feature in features], pad_token_id, value_mask)
+        if self.ATTENTION_MASK in features[0].keys():
+            batch[self.ATTENTION_MASK] = self.pad([feature[self.ATTENTION_MASK] for feature in features], 0, value_mask)
+        elif self.ATTENTION_MASK in self.tokenizer.model_input_names:
+            batch[self.ATTENTION_MASK] = value_mask.to(torch.int64)
+        if self.TOKEN_TYPE_IDS in features[0].keys():
+            batch[self.TOKEN_TYPE_IDS] = self.pad([feature[self.TOKEN_TYPE_IDS] for feature in features], self.tokenizer.pad_token_type_id, value_mask)
+        # head positions are padded like input_ids, which is how they used to be batched by HF
+        if Names.HEAD_POSITIONS in features[0].keys():
+            batch[Names.HEAD_POSITIONS] = self.pad([feature[Names.HEAD_POSITIONS] for feature in features], pad_token_id, value_mask)
+        if label_name in features[0].keys():
+            batch[label_name] = self.pad([feature[label_name] for feature in features], self.label_pad_token_id, value_mask)
+        if Names.TASK_IDS in features[0].keys():
+            batch[Names.TASK_IDS] = torch.tensor([feature[Names.TASK_IDS] for feature in features], dtype=torch.int64)
 
         return batch
@@ -3,18 +3,41 @@
 
 import torch
 
+from dataclasses import dataclass
 from datasets import Dataset
+from length_batcher import LengthBatcher
 from names import Names
 from parameters import Parameters
 from task import Task
 from token_classifier import TokenClassificationModel
 from torch import IntTensor, Tensor
 from tqdm.notebook import tqdm
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING, Union
+
+if TYPE_CHECKING:
+    from ort_model import OrtModel
+
+# A padded batch of evaluation data
+# The tensors stay on the CPU, since the batch can be shared by models on different devices
+@dataclass
+class EvaluationBatch:
+    inputs: Dict[str, Tensor]
+    golds: Tensor
 
 class Evaluator:
-    def __init__(self, model: TokenClassificationModel) -> None:
+    def __init__(self,
+        model: Union[TokenClassificationModel, "OrtModel"], max_batch_tokens: Optional[int] = Parameters.eval_max_batch_tokens,
+        batch_cache: Optional[Dict[Tuple[int, bool], List[EvaluationBatch]]] = None
+    ) -> None:
         self.model = model
+        # if None, predict() is used to run one sentence at a time; otherwise, sentences are batched
+        self.max_batch_tokens = max_batch_tokens
+        # batches by task id and useTest, which can be shared by evaluators of different models
+        self.batch_cache: Dict[Tuple[int, bool], List[EvaluationBatch]] = {} if batch_cache is None else batch_cache
+
+    # an evaluator for another model that reuses the batches already made by this one
+    def with_model(self, model: Union[TokenClassificationModel, "OrtModel"]) -> "Evaluator":
+        return Evaluator(model, self.max_batch_tokens, self.batch_cache)
         
     def data_to_tensor(self, dict: Dict[str, Tensor]) -> Dict[str, Tensor]: 
         predict_dict: Dict[str, Tensor] = {}
@@ -54,24 +77,92 @@ class Evaluator:
                 golds.extend(gold_labels.tolist())
         return (golds, predictions)
 
+    # pads the given rows on the right into [batch, max_length] tensors, including the attention mask and the gold labels
+    def rows_to_batch(self, rows: List[Dict[str, Any]]) -> EvaluationBatch:
+        max_length = max(len(row[Names.INPUT_IDS]) for row in rows)
+        input_ids = torch.zeros(len(rows), max_length, dtype=torch.long)
+        attention_mask = torch.zeros(len(rows), max_length, dtype=torch.long)
+        # padded head positions point to the first token, which is harmless since their predictions are dropped
+        head_positions = torch.zeros(len(rows), max_length, dtype=torch.long)
+        golds = torch.full((len(rows), max_length), Parameters.ignore_index, dtype=torch.long)
+        for index, row in enumerate(rows):
+            length = len(row[Names.INPUT_IDS])
+            input_ids[index, :length] = torch.tensor(row[Names.INPUT_IDS])
+            attention_mask[index, :length] = 1
+            head_positions[index, :length] = torch.tensor(row[Names.HEAD_POSITIONS])
+            golds[index, :length] = torch.tensor(row[Names.LABELS])
+        task_ids = torch.tensor([row[Names.TASK_IDS] for row in rows])
+        inputs = {
+            Names.INPUT_IDS: input_ids,
+            "attention_mask": attention_mask,
+            Names.HEAD_POSITIONS: head_positions,
+            Names.TASK_IDS: task_ids
+        }
+        return EvaluationBatch(inputs, golds)
+
+    # groups sentences of similar length into padded batches that stay within max_batch_tokens
+    def mk_batches(self, input_ids: List[List[int]], head_positions: List[List[int]], task_ids: List[int], labels: List[List[int]]) -> List[EvaluationBatch]:
+        assert self.max_batch_tokens is not None
+        rows: List[Dict[str, Any]] = [
+            {Names.INPUT_IDS: row_input_ids, Names.HEAD_POSITIONS: row_head_positions, Names.TASK_IDS: row_task_id, Names.LABELS: row_labels}
+            for row_input_ids, row_head_positions, row_task_id, row_labels in zip(input_ids, head_positions, task_ids, labels)
+        ]
+        return [
+            self.rows_to_batch([rows[index] for index in batch])
+            for batch in LengthBatcher.mk_batches([len(row[Names.INPUT_IDS]) for row in rows], self.max_batch_tokens)
+        ]
+
+    # the batches only depend on the data, not on the model, so they are made once per task and split and then reused
+    def get_batches(self, task: Task, useTest: bool) -> List[EvaluationBatch]:
+        key = (task.task_id, useTest)
+        if key not in self.batch_cache:
+            df = task.dev_df if not useTest else task.test_df
+            self.batch_cache[key] = self.mk_batches(df[Names.INPUT_IDS].tolist(), df[Names.HEAD_POSITIONS].tolist(), df[Names.TASK_IDS].tolist(), df[Names.LABELS].tolist())
+        return self.batch_cache[key]
+
+    # the predictions are on the device of the model
+    def predict_batch(self, batch: EvaluationBatch) -> Tensor:
+        device = self.model.device
+        model_output = self.model(**{key: value.to(device) for key, value in batch.inputs.items()})
+        return torch.argmax(model_output.logits, axis=-1)
+
+    # counts correct predictions right on the padded batches, where padding has the ignored gold label
+    def count_correct(self, batches: List[EvaluationBatch]) -> Tuple[int, int]:
+        self.model.eval()
+        self.model.training_mode = False
+        correct = 0
+        total = 0
+        with torch.no_grad():
+            for batch in tqdm(batches):
+                pred_labels = self.predict_batch(batch)
+                golds = batch.golds.to(pred_labels.device)
+                is_gold = golds != Parameters.ignore_index
+                correct += int((is_gold & (pred_labels == golds)).sum())
+                total += int(is_gold.sum())
+        return correct, total
+
     # compute accuracy using the model directly
     def evaluation_classification_report(self, task: Task, name: str, useTest: bool = False) -> Dict[str, float]:
         print(f"Classification report (useTest = {useTest}) for task {name}:")
         num_labels = task.num_labels
-        df = task.dev_df if not useTest else task.test_df
-        ds = Dataset.from_pandas(df)
 
-        golds, predictions = self.predict(ds)
-        #print("GOLDS: ", len(golds))
-        #print("PREDS: ", len(predictions))
+        if self.max_batch_tokens is not None:
+            correct, total = self.count_correct(self.get_batches(task, useTest))
+        else:
+            df = task.dev_df if not useTest else task.test_df
+            ds = Dataset.from_pandas(df)
 
-        correct = 0
-        total = 0
-        for i in range(len(golds)):
-            if golds[i] != Parameters.ignore_index:
-                total = total + 1
-                if golds[i] == predictions[i]:
-                    correct = correct + 1
+            golds, predictions = self.predict(ds)
+            #print("GOLDS: ", len(golds))
+            #print("PREDS: ", len(predictions))
+
+            correct = 0
+            total = 0
+            for i in range(len(golds)):
+                if golds[i] != Parameters.ignore_index:
+                    total = total + 1
+                    if golds[i] == predictions[i]:
+                        correct = correct + 1
         
         accuracy = correct / total
         print(f"correct = {correct}, total = {total}")
@@ -84,8 +175,12 @@ class Evaluator:
         print(accuracy)
         return accuracy
 
+    # evaluates self's model and returns the accuracy of each task by task name
+    def evaluate_tasks(self, tasks: List[Task]) -> Dict[str, float]:
+        return {task.task_name: self.evaluate_task(task)[Names.ACCURACY] for task in tasks}
+
     # evaluates self's model and returns macro accuracy on all tasks
     def evaluate(self, tasks: List[Task]) -> float:
-        accuracies = [self.evaluate_task(task)[Names.ACCURACY] for task in tasks]
+        accuracies = list(self.evaluate_tasks(tasks).values())
         macro_accuracy = sum(accuracies) / len(accuracies)
         return macro_accuracy
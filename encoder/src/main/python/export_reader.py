@@ -0,0 +1,62 @@
+import numpy as np
+import os
+
+from dataclasses import dataclass
+from file_utils import FileUtils
+from head_format import HeadFormat
+from typing import List, Tuple
+
+# A task as it was written by TokenClassificationModel.export_task.  It has the same task_id,
+# num_labels, and dual_mode as the Task it came from, so it can be used to add heads to a model.
+@dataclass
+class ExportedTask:
+    task_id: int
+    task_name: str
+    labels: List[str]
+    dual_mode: bool
+
+    @property
+    def num_labels(self) -> int:
+        return len(self.labels)
+
+# Reads the files of an exported model (see TokenClassificationModel.export_model) the way that
+# TokenClassifierFactory and LinearLayerFactory do on the JVM.
+class ExportReader:
+    @classmethod
+    def read_line(cls, file_name: str) -> str:
+        with FileUtils.for_reading(file_name) as file:
+            return file.readline().strip()
+
+    @classmethod
+    def read_lines(cls, file_name: str) -> List[str]:
+        with FileUtils.for_reading(file_name) as file:
+            return [line.strip() for line in file]
+
+    @classmethod
+    def read_task(cls, task_dir: str, task_id: int) -> ExportedTask:
+        binary_name = f"{task_dir}/{HeadFormat.binary_name}"
+        labels = HeadFormat.read_binary(binary_name)[0]["labels"] if os.path.exists(binary_name) else cls.read_lines(f"{task_dir}/labels")
+        return ExportedTask(
+            task_id,
+            cls.read_line(f"{task_dir}/name"),
+            labels,
+            cls.read_line(f"{task_dir}/dual") == "1"
+        )
+
+    # tasks are numbered consecutively from 0 and the first one without a name file ends the list
+    @classmethod
+    def read_tasks(cls, export_dir: str) -> List[ExportedTask]:
+        tasks: List[ExportedTask] = []
+        while os.path.exists(f"{export_dir}/tasks/{len(tasks)}/name"):
+            tasks.append(cls.read_task(f"{export_dir}/tasks/{len(tasks)}", len(tasks)))
+        return tasks
+
+    # the weights ([labels, inputs]) and biases of a task, from whichever format it was exported in
+    @classmethod
+    def read_weights(cls, task_dir: str, mmap: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        binary_name = f"{task_dir}/{HeadFormat.binary_name}"
+        if os.path.exists(binary_name):
+            _, weights, biases = HeadFormat.read_binary(binary_name, mmap)
+        else:
+            weights, biases, _ = HeadFormat.read_text(task_dir)
+        return weights, biases
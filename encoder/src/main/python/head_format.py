@@ -0,0 +1,93 @@
+import json
+import numpy as np
+import struct
+
+from file_utils import FileUtils
+from typing import Any, Dict, List, Tuple
+
+# Reads and writes the weights, biases, and labels of a task head.  The text format is the one that
+# the JVM reads from the weights, biases, and labels files of each task.  The binary format keeps
+# everything in a single file that can be memory-mapped:
+#
+#   magic           8 bytes, HeadFormat.magic
+#   header length   little-endian uint32
+#   header          UTF-8 JSON with task_name, dual, dtype, shape (rows = labels, cols = inputs), and labels
+#   padding         zeros up to a multiple of HeadFormat.alignment bytes
+#   weights         shape[0] * shape[1] little-endian float32 values in row-major order
+#   biases          shape[0] little-endian float32 values
+class HeadFormat:
+    magic = b"CLUHEAD1"
+    dtype = "<f4"
+    alignment = 16
+    binary_name = "head.bin"
+
+    @classmethod
+    def write_text(cls, task_dir: str, weights: np.ndarray, biases: np.ndarray, labels: List[str]) -> None:
+        with FileUtils.for_writing(f"{task_dir}/labels") as file:
+            for label in labels:
+                file.write(f"{label}\n")
+
+        with FileUtils.for_writing(f"{task_dir}/weights") as file:
+            file.write(f"# {weights.shape[0]} {weights.shape[1]}\n")
+            for x in weights:
+                for y in x:
+                    file.write(f"{y} ")
+                file.write("\n")
+
+        with FileUtils.for_writing(f"{task_dir}/biases") as file:
+            file.write(f"# {biases.shape[0]}\n")
+            for x in biases:
+                file.write(f"{x} ")
+            file.write("\n")
+
+    # lines starting with # are comments, as on the JVM
+    @classmethod
+    def read_text_values(cls, file_name: str) -> List[List[float]]:
+        with FileUtils.for_reading(file_name) as file:
+            return [[float(value) for value in line.split()] for line in file if not line.startswith("#")]
+
+    @classmethod
+    def read_text(cls, task_dir: str) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        weights = np.array(cls.read_text_values(f"{task_dir}/weights"), dtype=np.float32)
+        biases = np.array([value for values in cls.read_text_values(f"{task_dir}/biases") for value in values], dtype=np.float32)
+        with FileUtils.for_reading(f"{task_dir}/labels") as file:
+            labels = [line.strip() for line in file]
+        return weights, biases, labels
+
+    @classmethod
+    def write_binary(cls, file_name: str, task_name: str, dual_mode: bool, weights: np.ndarray, biases: np.ndarray, labels: List[str]) -> None:
+        header = json.dumps({
+            "task_name": task_name,
+            "dual": dual_mode,
+            "dtype": cls.dtype,
+            "shape": list(weights.shape),
+            "labels": labels
+        }).encode("utf-8")
+        prefix_length = len(cls.magic) + 4 + len(header)
+        padding = b"\0" * (-prefix_length % cls.alignment)
+        with open(file_name, "wb") as file:
+            file.write(cls.magic)
+            file.write(struct.pack("<I", len(header)))
+            file.write(header)
+            file.write(padding)
+            file.write(np.ascontiguousarray(weights, dtype=cls.dtype).tobytes())
+            file.write(np.ascontiguousarray(biases, dtype=cls.dtype).tobytes())
+
+    # returns the header along with the weights and biases, which are memory-mapped unless mmap is False
+    @classmethod
+    def read_binary(cls, file_name: str, mmap: bool = True) -> Tuple[Dict[str, Any], np.ndarray, np.ndarray]:
+        with open(file_name, "rb") as file:
+            magic = file.read(len(cls.magic))
+            if magic != cls.magic:
+                raise Exception(f"The file {file_name} is not a binary head file!")
+            header_length = struct.unpack("<I", file.read(4))[0]
+            header = json.loads(file.read(header_length).decode("utf-8"))
+        prefix_length = len(cls.magic) + 4 + header_length
+        offset = prefix_length + (-prefix_length % cls.alignment)
+        rows, cols = header["shape"]
+        values: np.ndarray
+        if mmap:
+            values = np.memmap(file_name, dtype=header["dtype"], mode="r", offset=offset, shape=(rows * cols + rows,))
+        else:
+            values = np.fromfile(file_name, dtype=header["dtype"], offset=offset, count=rows * cols + rows)
+        return header, values[:rows * cols].reshape(rows, cols), values[rows * cols:]
@@ -0,0 +1,55 @@
+import datasets
+
+from clu_profiler import CluProfiler
+from profiler_callback import ProfilerCallback
+from torch import nn, Tensor
+from torch.utils.data import DataLoader
+from token_budget_sampler import TokenBudgetBatchSampler
+from transformers import Trainer
+from typing import Any, Dict, List, Optional, Union
+
+# Our extension of the HF Trainer.  If max_batch_tokens is set, training batches are formed by
+# a TokenBudgetBatchSampler over the given lengths instead of per_device_train_batch_size.
+# The training step and checkpoint saves are also instrumented for the CluProfiler, if it is enabled.
+class HfTrainer(Trainer):
+    def __init__(self, *args: Any, train_lengths: Optional[List[int]] = None, max_batch_tokens: Optional[int] = None, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.train_lengths = train_lengths
+        self.max_batch_tokens = max_batch_tokens
+
+    def get_train_dataloader(self) -> DataLoader:
+        if self.max_batch_tokens is None or self.train_lengths is None:
+            return super().get_train_dataloader()
+
+        train_dataset = self.train_dataset
+        if isinstance(train_dataset, datasets.Dataset):
+            train_dataset = self._remove_unused_columns(train_dataset, description="training")
+        batch_sampler = TokenBudgetBatchSampler(self.train_lengths, self.max_batch_tokens, self.args.seed)
+        return DataLoader(
+            train_dataset,
+            batch_sampler=batch_sampler,
+            collate_fn=self.data_collator,
+            num_workers=self.args.dataloader_num_workers,
+            pin_memory=self.args.dataloader_pin_memory
+        )
+
+    def compute_loss(self, model: nn.Module, inputs: Dict[str, Union[Tensor, Any]], *args: Any, **kwargs: Any) -> Any:
+        with CluProfiler.span("forward_and_loss"):
+            result = super().compute_loss(model, inputs, *args, **kwargs)
+        CluProfiler.mark("loss_done")
+        return result
+
+    # the backward pass is the rest of the training step after compute_loss
+    def training_step(self, model: nn.Module, inputs: Dict[str, Union[Tensor, Any]], *args: Any, **kwargs: Any) -> Tensor:
+        with CluProfiler.span("training_step"):
+            loss = super().training_step(model, inputs, *args, **kwargs)
+            CluProfiler.span_since("backward", "loss_done")
+        CluProfiler.mark(ProfilerCallback.STEP_MARK)
+        if CluProfiler.enabled:
+            CluProfiler.count("sentences", inputs["input_ids"].shape[0])
+            CluProfiler.count("padded_tokens", inputs["input_ids"].numel())
+        return loss
+
+    def _save_checkpoint(self, *args: Any, **kwargs: Any) -> None:
+        with CluProfiler.span("checkpoint_save"):
+            super()._save_checkpoint(*args, **kwargs)
@@ -0,0 +1,24 @@
+from typing import List
+
+# Groups items of similar length so that padding them into a batch wastes little space.
+# A batch is closed as soon as its padded size (longest item * number of items) would exceed max_tokens.
+class LengthBatcher:
+    # indexes of the items sorted by increasing length; ties keep their original order
+    @classmethod
+    def sort_by_length(cls, lengths: List[int]) -> List[int]:
+        return sorted(range(len(lengths)), key=lambda index: lengths[index])
+
+    @classmethod
+    def mk_batches(cls, lengths: List[int], max_tokens: int) -> List[List[int]]:
+        batches: List[List[int]] = []
+        batch: List[int] = []
+        for index in cls.sort_by_length(lengths):
+            # items arrive in increasing length, so the current one is the longest in the batch
+            if batch and lengths[index] * (len(batch) + 1) > max_tokens:
+                batches.append(batch)
+                batch = []
+            # an item longer than max_tokens still gets a batch of its own
+            batch.append(index)
+        if batch:
+            batches.append(batch)
+        return batches
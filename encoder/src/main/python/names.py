@@ -7,6 +7,8 @@ class Names:
     # for dependency parsing, this dataset column indicates where the positions of the heads are stored
     HEAD_POSITIONS = "head_positions"
     TASK_IDS = "task_ids"
+    # the file inside a checkpoint directory that holds its dev accuracies
+    SCORES_FILE = "scores.json"
     TOKENIZER_NAMES = [
         "bert-base-cased",
         "distilbert-base-cased",
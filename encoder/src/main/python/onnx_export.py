@@ -0,0 +1,214 @@
+import inspect
+import numpy as np
+import torch
+
+from torch import nn, Tensor
+from transformers import AutoModel, AutoTokenizer
+from typing import Any, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from task import Task
+    from token_classifier import TokenClassificationModel
+
+# The encoder as it is seen by ONNX: explicit inputs in a fixed order and only the last hidden states as output.
+class EncoderWrapper(nn.Module):
+    def __init__(self, encoder: AutoModel) -> None:
+        super().__init__()
+        self.encoder = encoder
+
+    def forward(self, token_ids: Tensor, attention_mask: Tensor, token_type_ids: Optional[Tensor] = None) -> Tensor:
+        return self.encoder(token_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)[0]
+
+# The encoder and all task heads as a single graph.  The inputs arrive positionally in the order of input_names,
+# and there is one output per task, in the order of the tasks, with either its logits or its argmax labels.
+class ModelWrapper(nn.Module):
+    def __init__(self, model: "TokenClassificationModel", task_ids: List[int], input_names: List[str], argmax: bool) -> None:
+        super().__init__()
+        self.model = model
+        self.task_ids = task_ids
+        self.input_names = input_names
+        self.argmax = argmax
+
+    def forward(self, *inputs: Tensor) -> Tuple[Tensor, ...]:
+        named_inputs = dict(zip(self.input_names, inputs))
+        sequence_output = self.model.encoder(
+            named_inputs[OnnxExport.TOKEN_IDS],
+            attention_mask=named_inputs[OnnxExport.ATTENTION_MASK],
+            token_type_ids=named_inputs.get(OnnxExport.TOKEN_TYPE_IDS)
+        )[0]
+        all_logits = self.model.forward_all_heads(sequence_output, named_inputs.get(OnnxExport.HEAD_POSITIONS))
+        task_logits = [all_logits[task_id] for task_id in self.task_ids]
+        if self.argmax:
+            return tuple(torch.argmax(logits, dim=-1) for logits in task_logits)
+        else:
+            return tuple(task_logits)
+
+# Exports the encoder with dynamic batch and sequence axes so that padded batches can be run on the JVM.
+# The inputs are token_ids (named as in the original single-sentence export), attention_mask, and
+# token_type_ids, but the latter only for encoders that actually distinguish token types.  The whole model,
+# encoder and heads, can be exported the same way into a single graph, which additionally takes the
+# head_positions if there are dual-mode tasks.
+class OnnxExport:
+    TOKEN_IDS = "token_ids"
+    ATTENTION_MASK = "attention_mask"
+    TOKEN_TYPE_IDS = "token_type_ids"
+    HEAD_POSITIONS = "head_positions"
+    SEQUENCE_OUTPUT = "sequence_output"
+    LOGITS = "logits"
+    LABELS = "labels"
+
+    opset_version = 13
+    sample_sentences = [
+        ["Using", "transformers", "with", "ONNX", "runtime"],
+        ["Batches", "are", "padded"]
+    ]
+    # (batch size, maximum sentence length) of the random batches used to compare ONNX and PyTorch
+    check_shapes = [(1, 1), (1, 9), (3, 17), (8, 40)]
+    check_tolerance = 1e-4
+
+    @classmethod
+    def uses_token_type_ids(cls, encoder: AutoModel, tokenizer: AutoTokenizer) -> bool:
+        return cls.TOKEN_TYPE_IDS in tokenizer.model_input_names and getattr(encoder.config, "type_vocab_size", 0) > 1
+
+    @classmethod
+    def get_input_names(cls, use_token_type_ids: bool) -> List[str]:
+        input_names = [cls.TOKEN_IDS, cls.ATTENTION_MASK]
+        if use_token_type_ids:
+            input_names.append(cls.TOKEN_TYPE_IDS)
+        return input_names
+
+    # the outputs of the single graph are numbered like the task directories of the export
+    @classmethod
+    def get_output_names(cls, tasks: Sequence["Task"], argmax: bool) -> List[str]:
+        prefix = cls.LABELS if argmax else cls.LOGITS
+        return [f"{prefix}_{index}" for index in range(len(tasks))]
+
+    @classmethod
+    def get_dynamic_axes(cls, input_names: List[str], output_names: List[str]) -> Dict[str, Dict[int, str]]:
+        return {name: {0: "batch size", 1: "sent length"} for name in input_names + output_names}
+
+    # tokenizes the sample sentences into a right-padded batch in the order of the input names
+    @classmethod
+    def mk_sample_inputs(cls, tokenizer: AutoTokenizer, input_names: List[str], device: str) -> Tuple[Tensor, ...]:
+        token_input = tokenizer(cls.sample_sentences, is_split_into_words=True, padding=True, return_tensors="pt")
+        input_ids = token_input["input_ids"]
+        sample_inputs: Dict[str, Tensor] = {}
+        for input_name in input_names:
+            if input_name == cls.HEAD_POSITIONS:
+                # each token takes the one before it as its head, which keeps the positions within the sentence
+                sample_inputs[input_name] = (torch.arange(input_ids.shape[1]) - 1).clamp(min=0).expand_as(input_ids)
+            elif input_name == cls.TOKEN_IDS:
+                # the tokenizer calls the token ids input_ids
+                sample_inputs[input_name] = input_ids
+            else:
+                sample_inputs[input_name] = token_input[input_name]
+        return tuple(sample_input.to(device) for sample_input in sample_inputs.values())
+
+    # newer versions of torch default to the dynamo exporter, but the exports are made with the TorchScript one
+    @classmethod
+    def get_export_options(cls) -> Dict[str, Any]:
+        return {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+
+    # random right-padded batches with at least one full-length sentence, as numpy arrays by input name
+    @classmethod
+    def mk_check_inputs(cls, vocab_size: int, batch_size: int, max_length: int, input_names: List[str], rng: np.random.Generator) -> Dict[str, np.ndarray]:
+        lengths = rng.integers(1, max_length + 1, size=batch_size)
+        lengths[0] = max_length
+        attention_mask = (np.arange(max_length)[np.newaxis, :] < lengths[:, np.newaxis]).astype(np.int64)
+        inputs = {
+            cls.TOKEN_IDS: rng.integers(0, vocab_size, size=(batch_size, max_length), dtype=np.int64) * attention_mask,
+            cls.ATTENTION_MASK: attention_mask,
+            cls.TOKEN_TYPE_IDS: np.zeros((batch_size, max_length), dtype=np.int64),
+            cls.HEAD_POSITIONS: (rng.random((batch_size, max_length)) * lengths[:, np.newaxis]).astype(np.int64)
+        }
+        return {input_name: inputs[input_name] for input_name in input_names}
+
+    @classmethod
+    def export_encoder(cls, encoder: AutoModel, tokenizer: AutoTokenizer, file_name: str, device: str) -> None:
+        input_names = cls.get_input_names(cls.uses_token_type_ids(encoder, tokenizer))
+        torch.onnx.export(
+            EncoderWrapper(encoder),
+            cls.mk_sample_inputs(tokenizer, input_names, device),
+            file_name,
+            export_params=True,
+            do_constant_folding=True,
+            input_names=input_names,
+            output_names=[cls.SEQUENCE_OUTPUT],
+            opset_version=cls.opset_version,
+            dynamic_axes=cls.get_dynamic_axes(input_names, [cls.SEQUENCE_OUTPUT]),
+            **cls.get_export_options()
+        )
+
+    @classmethod
+    def export_model(cls, model: "TokenClassificationModel", tasks: Sequence["Task"], tokenizer: AutoTokenizer, file_name: str, device: str, argmax: bool) -> None:
+        input_names = cls.get_input_names(cls.uses_token_type_ids(model.encoder, tokenizer))
+        if any(task.dual_mode for task in tasks):
+            input_names.append(cls.HEAD_POSITIONS)
+        output_names = cls.get_output_names(tasks, argmax)
+        torch.onnx.export(
+            ModelWrapper(model, [task.task_id for task in tasks], input_names, argmax),
+            cls.mk_sample_inputs(tokenizer, input_names, device),
+            file_name,
+            export_params=True,
+            do_constant_folding=True,
+            input_names=input_names,
+            output_names=output_names,
+            opset_version=cls.opset_version,
+            dynamic_axes=cls.get_dynamic_axes(input_names, output_names),
+            **cls.get_export_options()
+        )
+
+    # compares the hidden states of the unpadded tokens from onnxruntime to those from PyTorch and raises if they differ
+    @classmethod
+    def check_encoder(cls, encoder: AutoModel, file_name: str, shapes: Sequence[Tuple[int, int]] = check_shapes, seed: int = 0) -> None:
+        import onnxruntime
+
+        session = onnxruntime.InferenceSession(file_name, providers=["CPUExecutionProvider"])
+        input_names = [session_input.name for session_input in session.get_inputs()]
+        wrapper = EncoderWrapper(encoder).to("cpu")
+        was_training = wrapper.training
+        wrapper.eval()
+        rng = np.random.default_rng(seed)
+        try:
+            for batch_size, max_length in shapes:
+                inputs = cls.mk_check_inputs(encoder.config.vocab_size, batch_size, max_length, input_names, rng)
+                onnx_output = session.run([cls.SEQUENCE_OUTPUT], inputs)[0]
+                with torch.no_grad():
+                    torch_output = wrapper(*[torch.from_numpy(inputs[input_name]) for input_name in input_names]).numpy()
+                is_token = inputs[cls.ATTENTION_MASK].astype(bool)
+                difference = float(np.abs(onnx_output[is_token] - torch_output[is_token]).max())
+                print(f"ONNX check with batch size {batch_size} and length {max_length}: maximum difference = {difference}")
+                if difference > cls.check_tolerance:
+                    raise Exception(f"The ONNX encoder in {file_name} differs from PyTorch by {difference} for batch size {batch_size} and length {max_length}!")
+        finally:
+            wrapper.train(was_training)
+
+    # compares the outputs of each task on the unpadded tokens, where labels only need to pick a maximal logit
+    @classmethod
+    def check_model(cls, model: "TokenClassificationModel", tasks: Sequence["Task"], file_name: str, argmax: bool, shapes: Sequence[Tuple[int, int]] = check_shapes, seed: int = 0) -> None:
+        import onnxruntime
+
+        session = onnxruntime.InferenceSession(file_name, providers=["CPUExecutionProvider"])
+        input_names = [session_input.name for session_input in session.get_inputs()]
+        wrapper = ModelWrapper(model, [task.task_id for task in tasks], input_names, False).to("cpu")
+        was_training = wrapper.training
+        wrapper.eval()
+        rng = np.random.default_rng(seed)
+        try:
+            for batch_size, max_length in shapes:
+                inputs = cls.mk_check_inputs(model.config.vocab_size, batch_size, max_length, input_names, rng)
+                onnx_outputs = session.run(cls.get_output_names(tasks, argmax), inputs)
+                with torch.no_grad():
+                    torch_outputs = [output.numpy() for output in wrapper(*[torch.from_numpy(inputs[input_name]) for input_name in input_names])]
+                is_token = inputs[cls.ATTENTION_MASK].astype(bool)
+                for task, onnx_output, torch_output in zip(tasks, onnx_outputs, torch_outputs):
+                    if argmax:
+                        chosen_logits = np.take_along_axis(torch_output, onnx_output[..., np.newaxis], axis=-1)[..., 0]
+                        difference = float((torch_output.max(axis=-1) - chosen_logits)[is_token].max())
+                    else:
+                        difference = float(np.abs(onnx_output[is_token] - torch_output[is_token]).max())
+                    print(f"ONNX check of task {task.task_name} with batch size {batch_size} and length {max_length}: maximum difference = {difference}")
+                    if difference > cls.check_tolerance:
+                        raise Exception(f"The ONNX model in {file_name} differs from PyTorch by {difference} for task {task.task_name}, batch size {batch_size}, and length {max_length}!")
+        finally:
+            wrapper.train(was_training)
@@ -0,0 +1,65 @@
+import json
+import os
+
+from evaluator import Evaluator
+from ort_model import OrtModel
+from parameters import Parameters
+from task import Task
+from token_classifier import TokenClassificationModel
+from typing import Dict, List, Optional
+
+# Quantizes the weights of an exported ONNX encoder to INT8 for CPU inference.  The dev accuracy of each task
+# is then compared between the PyTorch model and the quantized encoder, which is run by onnxruntime with the
+# heads of the model, and the quantized encoder is removed again if any task loses more than max_accuracy_drop.
+class OnnxQuantizer:
+    report_name = "quantization.json"
+
+    @classmethod
+    def get_quantized_file_name(cls, file_name: str) -> str:
+        root, extension = os.path.splitext(file_name)
+        return f"{root}.int8{extension}"
+
+    @classmethod
+    def quantize(cls, file_name: str, quantized_file_name: str) -> None:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(file_name, quantized_file_name, weight_type=QuantType.QInt8)
+
+    # returns the dev accuracies of the PyTorch model and of the quantized encoder by task name
+    @classmethod
+    def compare(cls, model: TokenClassificationModel, quantized_file_name: str, tasks: List[Task]) -> Dict[str, Dict[str, float]]:
+        evaluator = Evaluator(model)
+        accuracies = evaluator.evaluate_tasks(tasks)
+        # the dev batches that were just made are reused for the quantized encoder
+        quantized_accuracies = evaluator.with_model(OrtModel(quantized_file_name, model.output_heads)).evaluate_tasks(tasks)
+        return {
+            task.task_name: {
+                "pytorch": accuracies[task.task_name],
+                "int8": quantized_accuracies[task.task_name],
+                "drop": accuracies[task.task_name] - quantized_accuracies[task.task_name]
+            }
+            for task in tasks
+        }
+
+    @classmethod
+    def quantize_and_check(cls,
+        file_name: str, model: TokenClassificationModel, tasks: List[Task],
+        max_accuracy_drop: Optional[float] = None
+    ) -> str:
+        # taken from Parameters when this is called rather than when this module is imported
+        max_accuracy_drop = Parameters.quantization_max_accuracy_drop if max_accuracy_drop is None else max_accuracy_drop
+        quantized_file_name = cls.get_quantized_file_name(file_name)
+        print(f"Quantizing {file_name} to {quantized_file_name}...")
+        cls.quantize(file_name, quantized_file_name)
+        print(f"Sizes: fp32 = {os.path.getsize(file_name)} bytes, int8 = {os.path.getsize(quantized_file_name)} bytes")
+        report = cls.compare(model, quantized_file_name, tasks)
+        report_file_name = f"{os.path.dirname(file_name)}/{cls.report_name}"
+        with open(report_file_name, "w", encoding=Parameters.encoding) as file:
+            json.dump({"max_accuracy_drop": max_accuracy_drop, "tasks": report}, file, indent=2)
+        for task_name, accuracies in report.items():
+            print(f"Task {task_name}: pytorch = {accuracies['pytorch']}, int8 = {accuracies['int8']}, drop = {accuracies['drop']}")
+        failed_task_names = [task_name for task_name, accuracies in report.items() if accuracies["drop"] > max_accuracy_drop]
+        if failed_task_names:
+            os.remove(quantized_file_name)
+            raise Exception(f"The quantized encoder loses more than {max_accuracy_drop} accuracy on the tasks {failed_task_names}; see {report_file_name}!")
+        return quantized_file_name
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import json
+import numpy as np
+import time
+import torch
+
+from averaging_trainer import AveragingTrainer
+from clu_tokenizer import CluTokenizer
+from evaluator import Evaluator
+from export_reader import ExportedTask
+from ort_model import OrtModel
+from parameters import Parameters
+from task import Task
+from typing import Any, Dict, List, Sequence
+
+# Checks an export directory before it is released: the dev accuracy of each task when the export is run by
+# onnxruntime on the CPU, which should match that of the PyTorch model, and the speed of the exported model
+# on batches of random tokens of each combination of sequence length and batch size.
+class OrtBenchmark:
+    percentiles = [50, 95, 99]
+
+    # the exported tasks must be the tasks being evaluated, in the same order and with the same labels
+    @classmethod
+    def check_tasks(cls, exported_tasks: List[ExportedTask], tasks: List[Task]) -> None:
+        if [(task.task_id, task.task_name, task.labels) for task in exported_tasks] != [(task.task_id, task.task_name, task.labels) for task in tasks]:
+            raise Exception("The exported tasks do not match the tasks to be evaluated!")
+
+    @classmethod
+    def evaluate(cls, model: OrtModel, exported_tasks: List[ExportedTask], tasks: List[Task]) -> Dict[str, float]:
+        cls.check_tasks(exported_tasks, tasks)
+        return Evaluator(model).evaluate_tasks(tasks)
+
+    # rows are spread over the tasks so that every head is run, and dual-mode heads get random head positions
+    @classmethod
+    def mk_batch(cls, vocab_size: int, num_tasks: int, batch_size: int, length: int, rng: np.random.Generator) -> Dict[str, torch.Tensor]:
+        return {
+            "input_ids": torch.from_numpy(rng.integers(0, vocab_size, size=(batch_size, length), dtype=np.int64)),
+            "attention_mask": torch.ones(batch_size, length, dtype=torch.long),
+            "head_positions": torch.from_numpy(rng.integers(0, length, size=(batch_size, length), dtype=np.int64)),
+            "task_ids": torch.arange(batch_size) % num_tasks
+        }
+
+    # returns latencies in milliseconds per batch and sentences per second for each (length, batch size)
+    @classmethod
+    def benchmark(cls,
+        model: OrtModel, vocab_size: int, lengths: Sequence[int], batch_sizes: Sequence[int],
+        iterations: int = 20, warmup: int = 3, seed: int = 0
+    ) -> List[Dict[str, Any]]:
+        rng = np.random.default_rng(seed)
+        num_tasks = len(model.output_heads)
+        results = []
+        with torch.no_grad():
+            for length in lengths:
+                for batch_size in batch_sizes:
+                    batch = cls.mk_batch(vocab_size, num_tasks, batch_size, length, rng)
+                    for _ in range(warmup):
+                        model(**batch)
+                    latencies = []
+                    for _ in range(iterations):
+                        start_time = time.perf_counter()
+                        model(**batch)
+                        latencies.append(time.perf_counter() - start_time)
+                    result: Dict[str, Any] = {
+                        "length": length,
+                        "batch_size": batch_size,
+                        "sentences_per_second": batch_size * iterations / sum(latencies)
+                    }
+                    for percentile, latency in zip(cls.percentiles, np.percentile(latencies, cls.percentiles)):
+                        result[f"p{percentile}_ms"] = float(latency) * 1000
+                    print(
+                        f"length = {length}, batch size = {batch_size}: {result['sentences_per_second']:.1f} sentences/sec, " +
+                        ", ".join(f"p{percentile} = {result[f'p{percentile}_ms']:.2f} ms" for percentile in cls.percentiles)
+                    )
+                    results.append(result)
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate and benchmark an exported model with onnxruntime on the CPU.")
+    parser.add_argument("export_dir", help="directory with the exported model, e.g., the averaged export")
+    parser.add_argument("--encoder", default="encoder.onnx", help="name of the encoder file in the export directory, e.g., encoder.int8.onnx")
+    parser.add_argument("--threads", type=int, default=None, help="number of onnxruntime threads; the default is onnxruntime's")
+    parser.add_argument("--no-eval", action="store_true", help="skip the dev evaluation")
+    parser.add_argument("--lengths", type=int, nargs="*", default=[16, 32, 64, 128], help="sequence lengths to benchmark; none skips the benchmark")
+    parser.add_argument("--batch-sizes", type=int, nargs="*", default=[1, 8, 32])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--output", default=None, help="JSON file for the accuracies and benchmark results")
+    args = parser.parse_args()
+    # picks the device and seeds the random number generators, as the trainers do
+    Parameters.resolve()
+
+    model, exported_tasks = OrtModel.load(args.export_dir, args.encoder, args.threads)
+    tokenizer = CluTokenizer.get_pretrained()
+    report: Dict[str, Any] = {"export_dir": args.export_dir, "encoder": args.encoder}
+    if not args.no_eval:
+        # the tasks must be those that the exported model was trained on
+        tasks = Task.mk_tasks("data/", tokenizer, AveragingTrainer.short_task_defs)
+        report["accuracies"] = OrtBenchmark.evaluate(model, exported_tasks, tasks)
+    if args.lengths:
+        report["benchmark"] = OrtBenchmark.benchmark(model, tokenizer.vocab_size, args.lengths, args.batch_sizes, args.iterations)
+    if args.output is not None:
+        with open(args.output, "w", encoding=Parameters.encoding) as file:
+            json.dump(report, file, indent=2)
@@ -0,0 +1,77 @@
+import numpy as np
+import torch
+
+from export_reader import ExportedTask, ExportReader
+from onnx_export import OnnxExport
+from parameters import Parameters
+from token_classifier import TokenClassificationHead, TokenClassificationModel, linear_pos
+from torch import nn, Tensor
+from transformers.modeling_outputs import TokenClassifierOutput
+from typing import Any, List, Optional, Tuple
+
+# Stands in for a TokenClassificationModel during evaluation, but the encoder is an ONNX file that is run by
+# onnxruntime on the CPU.  The heads are ordinary TokenClassificationHeads that are applied to its output with
+# TokenClassificationModel.forward_heads, so the Evaluator can score the ONNX encoder just like the model.
+# Encoders exported for single sentences (only token_ids) are run one unpadded sentence at a time.
+# With load, everything comes from an export directory, which is read the same way as on the JVM.
+class OrtModel(nn.Module):
+    def __init__(self, encoder_file_name: str, output_heads: nn.ModuleDict, num_threads: Optional[int] = None) -> None:
+        import onnxruntime
+
+        super().__init__()
+        options = onnxruntime.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(encoder_file_name, options, providers=["CPUExecutionProvider"])
+        self.input_names = [session_input.name for session_input in self.session.get_inputs()]
+        self.output_heads = output_heads
+        self.training_mode = False
+
+    @property
+    def device(self) -> torch.device:
+        return torch.device("cpu")
+
+    def encode(self, input_ids: Tensor, attention_mask: Tensor, token_type_ids: Optional[Tensor]) -> Tensor:
+        if OnnxExport.ATTENTION_MASK in self.input_names:
+            inputs = {OnnxExport.TOKEN_IDS: input_ids, OnnxExport.ATTENTION_MASK: attention_mask}
+            if OnnxExport.TOKEN_TYPE_IDS in self.input_names:
+                inputs[OnnxExport.TOKEN_TYPE_IDS] = torch.zeros_like(input_ids) if token_type_ids is None else token_type_ids
+            return torch.from_numpy(self.session.run(None, {name: value.cpu().numpy() for name, value in inputs.items()})[0])
+        else:
+            sequence_outputs = []
+            for row_input_ids, row_attention_mask in zip(input_ids, attention_mask):
+                row_token_ids = row_input_ids[row_attention_mask.bool()].cpu().numpy()[np.newaxis, :]
+                sequence_outputs.append(torch.from_numpy(self.session.run(None, {OnnxExport.TOKEN_IDS: row_token_ids})[0][0]))
+            sequence_output = torch.zeros(input_ids.shape + sequence_outputs[0].shape[-1:])
+            for index, (row_sequence_output, row_attention_mask) in enumerate(zip(sequence_outputs, attention_mask)):
+                sequence_output[index, row_attention_mask.bool()] = row_sequence_output
+            return sequence_output
+
+    def forward(self,
+        input_ids: Optional[Tensor] = None, attention_mask: Optional[Tensor] = None, token_type_ids: Optional[Tensor] = None,
+        labels: Optional[Tensor] = None, head_positions: Optional[Tensor] = None, task_ids: Optional[Tensor] = None, **kwargs: Any
+    ) -> TokenClassifierOutput:
+        # these are only optional to match the signature of TokenClassificationModel.forward
+        assert input_ids is not None and task_ids is not None
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        sequence_output = self.encode(input_ids.to(torch.long), attention_mask.to(torch.long), token_type_ids)
+        logits, loss = TokenClassificationModel.forward_heads(self.output_heads, sequence_output, head_positions, labels, attention_mask, task_ids, True)
+        return TokenClassifierOutput(loss=loss, logits=logits)
+
+    @classmethod
+    def load_head(cls, task_dir: str, task: ExportedTask) -> TokenClassificationHead:
+        weights, biases = ExportReader.read_weights(task_dir, mmap=False)
+        input_size = weights.shape[1]
+        hidden_size = input_size // 2 if task.dual_mode and Parameters.use_concat else input_size
+        head = TokenClassificationHead(hidden_size, task.num_labels, task.task_id, task.dual_mode)
+        head.classifier[linear_pos].weight.data.copy_(torch.from_numpy(weights))
+        head.classifier[linear_pos].bias.data.copy_(torch.from_numpy(biases))
+        return head
+
+    # the heads are keyed by the number of their task directory, which is the task_id of the task they were exported from
+    @classmethod
+    def load(cls, export_dir: str, encoder_name: str = "encoder.onnx", num_threads: Optional[int] = None) -> Tuple["OrtModel", List[ExportedTask]]:
+        tasks = ExportReader.read_tasks(export_dir)
+        output_heads = nn.ModuleDict({str(task.task_id): cls.load_head(f"{export_dir}/tasks/{task.task_id}", task) for task in tasks})
+        return OrtModel(f"{export_dir}/{encoder_name}", output_heads, num_threads).eval(), tasks
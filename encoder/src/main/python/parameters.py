@@ -1,33 +1,83 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-import numpy as np
 import platform
-import random
-import torch 
 
-class Parameters:
+from typing import Any, Dict, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import torch
+
+# Settings that need torch, i.e., the device, and the seeding of the random number generators are resolved
+# only when they are first needed so that importing Parameters is cheap for code that only uses, e.g., the
+# tokenizer or the data files.  Reading any of the device attributes resolves the device, and resolve()
+# additionally seeds everything.  Until then, avoid_cuda, avoid_mps, and seed can still be changed.
+class LazyParameters(type):
+    device_names = {"device", "use_mps_device", "use_cuda_device"}
+
+    def __getattr__(cls, name: str) -> Any:
+        if name in LazyParameters.device_names:
+            cls.resolve_device()
+            return type.__getattribute__(cls, name)
+        raise AttributeError(f"type object '{cls.__name__}' has no attribute '{name}'")
+
+    def resolve_device(cls) -> None:
+        import torch
+
+        # select device
+        if not cls.avoid_cuda and torch.cuda.is_available():
+            device = torch.device("cuda")
+        elif not cls.avoid_mps and "arm64" in platform.platform():
+            device = torch.device("mps") # "mps"
+        else:
+            device = torch.device("cpu")
+        print(f"Using device: {device.type}")
+        cls.use_mps_device = str(device) == "mps"
+        cls.use_cuda_device = str(device) == "cuda"
+        cls.device = device
+
+    def resolve_seed(cls) -> None:
+        import numpy as np
+        import random
+        import torch
+
+        # random seed
+        if cls.seed is not None:
+            print(f"Setting all random seeds to: {cls.seed}")
+            random.seed(cls.seed)
+            np.random.seed(cls.seed)
+            torch.manual_seed(cls.seed)
+
+    # the settings as they are now, except for the resolved ones, so that they can be passed on to spawned
+    # processes, which would otherwise start out with the defaults again
+    def get_settings(cls) -> Dict[str, Any]:
+        return {
+            name: value for name, value in vars(cls).items()
+            if not name.startswith("_") and not callable(value) and name not in LazyParameters.device_names and name != "resolved"
+        }
+
+    def set_settings(cls, settings: Dict[str, Any]) -> None:
+        for name, value in settings.items():
+            setattr(cls, name, value)
+
+    # resolves the device and seeds the random number generators, but only the first time that it is called
+    def resolve(cls) -> None:
+        if not cls.resolved:
+            cls.device
+            cls.resolve_seed()
+            cls.resolved = True
+
+class Parameters(metaclass=LazyParameters):
     avoid_cuda = False
     avoid_mps = False
-    # select device
-    if not avoid_cuda and torch.cuda.is_available():
-        device = torch.device("cuda")
-    elif not avoid_mps and "arm64" in platform.platform():
-        device = torch.device("mps") # "mps"
-    else:
-        device = torch.device("cpu")
-    print(f"Using device: {device.type}") 
-    use_mps_device: bool = str(device) == "mps"
-    use_cuda_device: bool = str(device) == "cuda"
-    device: torch.device = device
-
-    # random seed
-    seed = 1234
-    if seed is not None:
-        print(f"Setting all random seeds to: {seed}")
-        random.seed(seed)
-        np.random.seed(seed)
-        torch.manual_seed(seed)
+    # these are set by LazyParameters.resolve_device when they are first read
+    device: "torch.device"
+    use_mps_device: bool
+    use_cuda_device: bool
+
+    # random seed, which is applied by resolve()
+    seed: Optional[int] = 1234
+    resolved: bool = False
 
     # pytorch ignores this label in the loss
     ignore_index: int = -100
@@ -35,8 +85,46 @@ class Parameters:
     # training settings
     epochs: int = 20
     batch_size: int = 2 # batch size of 8 works with both bert-large and bert-base
+    # if set, training batches are grouped by length and filled up to this many (padded) tokens instead of batch_size sentences
+    max_batch_tokens: Optional[int] = None
     weight_decay: float = 0.01
 
+    # data settings
+    # number of sentences tokenized together in one call to the (fast) tokenizer
+    tokenizer_batch_size: int = 1024
+    # directory in which tokenized datasets are cached between runs, e.g., "cache"; None, the default, disables the cache
+    cache_dir: Optional[str] = None
+    # number of words whose subword ids are remembered between sentences (see WordPieceCache), e.g., 100000
+    # None, the default, always uses the tokenizer
+    word_piece_cache_size: Optional[int] = None
+
+    # evaluation settings
+    # maximum number of (padded) tokens in one prediction batch; None predicts one sentence at a time
+    eval_max_batch_tokens: Optional[int] = 4096
+    # number of processes that score checkpoints in parallel; 1 scores them one after another in this process
+    eval_workers: int = 1
+    # whether each checkpoint is scored on the dev partitions while training, right after it is saved
+    eval_on_save: bool = True
+
+    # profiling settings
+    # directory into which the CluProfiler writes the spans and counters of training and averaging; None disables it
+    profile_dir: Optional[str] = None
+    # either "jsonl" for JSON lines or "chrome" for a Chrome trace
+    profile_format: str = "jsonl"
+
+    # export settings
+    # whether the ONNX encoder takes padded batches with an attention mask rather than a single sentence
+    export_dynamic_batch: bool = False
+    # whether the encoder and all heads are also exported together as model.onnx, which outputs logits or, if labels, argmax labels
+    export_single_graph: bool = False
+    export_single_graph_labels: bool = False
+    # whether the weights and biases of each head are written in the binary format of HeadFormat rather than as text
+    # the JVM only reads the text format so far, so this is for Python consumers like ExportReader and the Annotator
+    export_binary_heads: bool = False
+    # whether an INT8 copy of the encoder is exported as encoder.int8.onnx, which must stay within this dev accuracy of the original
+    export_quantized: bool = False
+    quantization_max_accuracy_drop: float = 0.01
+
     # which transformer to use
     # see this page for other options: https://huggingface.co/google/bert_uncased_L-4_H-256_A-4
     # transformer_name: str = "bert-base-cased" 
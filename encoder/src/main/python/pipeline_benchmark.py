@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import json
+import numpy as np
+import os
+import pandas as pd
+import platform
+import time
+import torch
+import tracemalloc
+import transformers
+
+from batch_aligner import BatchAligner
+from clu_tokenizer import CluTokenizer
+from data_wrangler import DataWrangler
+from datasets import Dataset
+from dual_data_collator import DualDataCollator
+from file_utils import FileUtils
+from names import Names
+from parameters import Parameters
+from transformers import AutoTokenizer
+from typing import Any, Callable, Dict, List, Tuple
+from word_piece_cache import WordPieceCache
+
+# The shape of a synthetic corpus.  Sentence lengths are drawn from a lognormal distribution with the given
+# mean and are clipped to [1, max_length].  Words come from a vocabulary of random lowercase strings.
+class CorpusConfig:
+    # the corpus must be the same from run to run, so unlike Parameters.seed, this is never None
+    default_seed = 1234
+
+    def __init__(self,
+        num_sentences: int = 2000, num_labels: int = 20, mean_length: float = 20.0, length_sigma: float = 0.5,
+        max_length: int = 100, vocabulary_size: int = 5000, seed: int = default_seed
+    ) -> None:
+        self.num_sentences = num_sentences
+        self.num_labels = num_labels
+        self.mean_length = mean_length
+        self.length_sigma = length_sigma
+        self.max_length = max_length
+        self.vocabulary_size = vocabulary_size
+        self.seed = seed
+
+# Times the stages of the data pipeline on synthetic CoNLL files so that their cost can be compared between
+# versions of the code without the real corpora.  Each stage is run once for its time and, unless disabled,
+# once more under tracemalloc for its peak memory, since tracing slows the code down considerably.
+# The process-wide word piece caches are cleared before every run so that each one starts cold.
+class PipelineBenchmark:
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+
+    @classmethod
+    def mk_vocabulary(cls, config: CorpusConfig, rng: np.random.Generator) -> List[str]:
+        word_lengths = rng.integers(1, 13, size=config.vocabulary_size)
+        return ["".join(rng.choice(cls.letters, size=word_length)) for word_length in word_lengths]
+
+    @classmethod
+    def mk_lengths(cls, config: CorpusConfig, rng: np.random.Generator) -> np.ndarray:
+        # the mu of the lognormal is chosen so that its mean is mean_length
+        mu = np.log(config.mean_length) - config.length_sigma ** 2 / 2
+        lengths = np.rint(rng.lognormal(mu, config.length_sigma, size=config.num_sentences)).astype(int)
+        return np.clip(lengths, 1, config.max_length)
+
+    # writes "word \t label" lines, or "word \t label \t head" lines with absolute head positions (-1 for root)
+    @classmethod
+    def write_conll(cls, file_name: str, config: CorpusConfig, with_heads: bool) -> None:
+        rng = np.random.default_rng(config.seed + with_heads)
+        vocabulary = cls.mk_vocabulary(config, rng)
+        labels = [f"L{index}" for index in range(config.num_labels)]
+        with FileUtils.for_writing(file_name) as file:
+            for length in cls.mk_lengths(config, rng):
+                word_indexes = rng.integers(0, len(vocabulary), size=length)
+                label_indexes = rng.integers(0, len(labels), size=length)
+                heads = rng.integers(-1, length, size=length)
+                for word_index, label_index, head in zip(word_indexes, label_indexes, heads):
+                    columns = [vocabulary[word_index], labels[label_index]]
+                    if with_heads:
+                        columns.append(str(head))
+                    file.write("\t".join(columns) + "\n")
+                file.write("\n")
+
+    @classmethod
+    def measure(cls, name: str, func: Callable[[], Any], items: int, trace_memory: bool) -> Tuple[Dict[str, Any], Any]:
+        WordPieceCache.caches.clear()
+        start_time = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start_time
+        measurement: Dict[str, Any] = {
+            "stage": name,
+            "items": items,
+            "seconds": seconds,
+            "items_per_second": items / seconds if seconds > 0 else None
+        }
+        if trace_memory:
+            WordPieceCache.caches.clear()
+            tracemalloc.start()
+            try:
+                func()
+                measurement["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        print(f"{name}: {items} items in {seconds:.3f} s" + (f", peak memory = {measurement['peak_bytes']} bytes" if trace_memory else ""))
+        return measurement, result
+
+    @classmethod
+    def run(cls,
+        tokenizer: AutoTokenizer, config: CorpusConfig, work_dir: str, batch_size: int = Parameters.batch_size,
+        trace_memory: bool = True
+    ) -> List[Dict[str, Any]]:
+        os.makedirs(work_dir, exist_ok=True)
+        file_names = [f"{work_dir}/synthetic.txt", f"{work_dir}/synthetic.heads"]
+        for file_name in file_names:
+            cls.write_conll(file_name, config, file_name.endswith(".heads"))
+
+        measurements = []
+        frames = []
+        for task_id, file_name in enumerate(file_names):
+            task_name = os.path.basename(file_name)
+            measurement, labels = cls.measure(f"read_label_set({task_name})", lambda: DataWrangler.read_label_set(file_name), config.num_sentences, trace_memory)
+            measurements.append(measurement)
+            label_to_index = {label: index for index, label in enumerate(labels)}
+            measurement, df = cls.measure(
+                f"read_dataframe({task_name})", lambda: DataWrangler.read_dataframe(file_name, label_to_index, task_id, tokenizer),
+                config.num_sentences, trace_memory
+            )
+            measurements.append(measurement)
+            frames.append(df)
+
+        # the alignment works on the output of the tokenizer, which comes from the frame of the task with heads
+        sentences = DataWrangler.read_sentences(file_names[1])
+        df = frames[1]
+        word_ids = df["word_ids"].tolist()
+        label_to_index = {label: index for index, label in enumerate(DataWrangler.read_label_set(file_names[1]))}
+        measurements.append(cls.measure(
+            "align_labels",
+            lambda: [DataWrangler.align_labels(sentence_word_ids, sentence.labels, label_to_index) for sentence_word_ids, sentence in zip(word_ids, sentences)],
+            len(sentences), trace_memory
+        )[0])
+        measurements.append(cls.measure(
+            "align_head_positions",
+            lambda: [DataWrangler.align_head_positions(sentence_word_ids, sentence.head_positions) for sentence_word_ids, sentence in zip(word_ids, sentences)],
+            len(sentences), trace_memory
+        )[0])
+        measurements.append(cls.measure(
+            "BatchAligner.align",
+            lambda: BatchAligner.align(word_ids, [sentence.labels for sentence in sentences], [sentence.head_positions for sentence in sentences], label_to_index),
+            len(sentences), trace_memory
+        )[0])
+
+        train_df = pd.concat(frames)
+        measurement, train_ds = cls.measure("Dataset.from_pandas", lambda: Dataset.from_pandas(train_df), len(train_df), trace_memory)
+        measurements.append(measurement)
+
+        # these are the columns that the trainer passes on to the collator
+        columns = [Names.INPUT_IDS, Names.LABELS, Names.HEAD_POSITIONS, Names.TASK_IDS]
+        features = list(train_ds.remove_columns([column for column in train_ds.column_names if column not in columns]))
+        batches = [features[start:start + batch_size] for start in range(0, len(features), batch_size)]
+        data_collator = DualDataCollator(tokenizer)
+        measurements.append(cls.measure(
+            f"DualDataCollator.torch_call(batch_size={batch_size})", lambda: [data_collator.torch_call(batch) for batch in batches],
+            len(features), trace_memory
+        )[0])
+        return measurements
+
+    @classmethod
+    def write_results(cls, file_name: str, tokenizer: AutoTokenizer, config: CorpusConfig, measurements: List[Dict[str, Any]]) -> None:
+        results = {
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "torch": torch.__version__,
+                "transformers": transformers.__version__,
+                "tokenizer": tokenizer.name_or_path,
+                # None if the tokenizer is used directly; either way, each measured run starts without cached words
+                "word_piece_cache_size": Parameters.word_piece_cache_size
+            },
+            "corpus": vars(config),
+            "measurements": measurements
+        }
+        with open(file_name, "w", encoding=Parameters.encoding) as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the stages of the data pipeline on synthetic CoNLL files.")
+    parser.add_argument("--tokenizer", default=Parameters.transformer_name)
+    parser.add_argument("--sentences", type=int, default=2000)
+    parser.add_argument("--labels", type=int, default=20)
+    parser.add_argument("--mean-length", type=float, default=20.0)
+    parser.add_argument("--length-sigma", type=float, default=0.5)
+    parser.add_argument("--max-length", type=int, default=100)
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=Parameters.batch_size)
+    parser.add_argument("--seed", type=int, default=CorpusConfig.default_seed)
+    parser.add_argument("--no-memory", action="store_true", help="skip the second run of each stage that measures peak memory")
+    parser.add_argument("--work-dir", default="benchmark")
+    parser.add_argument("--output", default="benchmark/results.json")
+    args = parser.parse_args()
+    # picks the device and seeds the random number generators, as the trainers do
+    Parameters.resolve()
+
+    tokenizer = CluTokenizer.get_pretrained(args.tokenizer)
+    config = CorpusConfig(args.sentences, args.labels, args.mean_length, args.length_sigma, args.max_length, args.vocabulary, args.seed)
+    measurements = PipelineBenchmark.run(tokenizer, config, args.work_dir, args.batch_size, not args.no_memory)
+    PipelineBenchmark.write_results(args.output, tokenizer, config, measurements)
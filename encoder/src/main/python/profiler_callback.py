@@ -0,0 +1,15 @@
+from clu_profiler import CluProfiler
+from transformers import TrainerCallback, TrainerControl, TrainerState, TrainingArguments
+from typing import Any
+
+# Adds the parts of a training step that the HF Trainer does outside of HfTrainer.training_step, which are mostly
+# the optimizer step.  The profile is closed by CluTrainer.train, even if training fails.
+class ProfilerCallback(TrainerCallback):
+    STEP_MARK = "training_step"
+
+    def on_step_end(self, args: TrainingArguments, state: TrainerState, control: TrainerControl, **kwargs: Any) -> None:
+        CluProfiler.span_since("optimizer_step", self.STEP_MARK, step=state.global_step)
+        CluProfiler.count("optimizer_steps")
+
+    def on_epoch_end(self, args: TrainingArguments, state: TrainerState, control: TrainerControl, **kwargs: Any) -> None:
+        CluProfiler.count("epochs")
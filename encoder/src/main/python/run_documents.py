@@ -1,40 +1,66 @@
-from clu_tokenizer import CluTokenizer
+import argparse
+import os
+
+from concurrent.futures import ProcessPoolExecutor
 from file_utils import FileUtils
+from itertools import islice
 from names import Names
 from parameters import Parameters
+from tokenizer_registry import TokenizerRegistry
+from typing import Iterator, List, TextIO
 
-def run_document(in_file_name: str, out_file_name: str, tokenizer_name: str) -> None:
-    tokenizer = CluTokenizer.get_pretrained(tokenizer_name)
-    with FileUtils.for_writing(out_file_name) as out_file:
-        with FileUtils.for_reading(in_file_name) as in_file:
-            for line in in_file:
-                line = line.strip()
+# size of the buffer of the output files
+buffer_size = 1 << 20
 
-                tokenized_line = tokenizer(line)
-                ids_from_line = tokenized_line.input_ids
-                tokens_from_line = tokenizer.convert_ids_to_tokens(ids_from_line)
+def read_batches(in_file: TextIO) -> Iterator[List[str]]:
+    while True:
+        lines = [line.strip() for line in islice(in_file, Parameters.tokenizer_batch_size)]
+        if not lines:
+            return
+        yield lines
 
-                words = line.split(" ")
-                tokenized_words = tokenizer(words, is_split_into_words=True)
-                ids_from_words = tokenized_words.input_ids
-                tokens_from_words = tokenizer.convert_ids_to_tokens(ids_from_words)
+# Writes each line followed by its tokens and ids.  If check is set, the lines are also tokenized as a whole
+# so that any difference to the tokenization of the words can be printed.  This never happens, probably
+# because the sentences are pre-tokenized with spaces added between the tokens.  The tokenizers come from the
+# registry, so the bundled ones are used where they exist and only the others are loaded from the hub.
+def run_document(in_file_name: str, out_file_name: str, tokenizer_name: str, check: bool = False) -> None:
+    tokenizer = TokenizerRegistry.get(tokenizer_name)
+    with open(out_file_name, "w", encoding=Parameters.encoding, buffering=buffer_size) as out_file:
+        with FileUtils.for_reading(in_file_name) as in_file:
+            for lines in read_batches(in_file):
+                tokenized_words = tokenizer([line.split(" ") for line in lines], is_split_into_words=True)
+                all_ids_from_words = tokenized_words.input_ids
+                all_tokens_from_words = [tokenizer.convert_ids_to_tokens(ids_from_words) for ids_from_words in all_ids_from_words]
 
-                # This never happens, probably because the sentences are pre-tokenized
-                # with spaces added between the tokens.
-                if tokens_from_line != tokens_from_words:
-                    print(tokens_from_line, tokens_from_words)
+                if check:
+                    for ids_from_line, tokens_from_words in zip(tokenizer(lines).input_ids, all_tokens_from_words):
+                        tokens_from_line = tokenizer.convert_ids_to_tokens(ids_from_line)
+                        if tokens_from_line != tokens_from_words:
+                            print(tokens_from_line, tokens_from_words)
 
-                print(line, file=out_file)
-                print(tokens_from_words, file=out_file)
-                print(ids_from_words, file=out_file)
+                out_file.write("".join(
+                    f"{line}\n{tokens_from_words}\n{ids_from_words}\n"
+                    for line, tokens_from_words, ids_from_words in zip(lines, all_tokens_from_words, all_ids_from_words)
+                ))
 
-def run_directory(directory_name: str, in_document_name: str) -> None:
+# each tokenizer gets its own process, so up to len(Names.TOKENIZER_NAMES) cores are used
+def run_directory(directory_name: str, in_document_name: str, check: bool = False, workers: int = os.cpu_count() or 1) -> None:
     in_file_name = f"{directory_name}/{in_document_name}"
-    for tokenizer_name in Names.TOKENIZER_NAMES:
-        out_file_name = f"{directory_name}/{Parameters.get_model_name(tokenizer_name)}.txt"
-        run_document(in_file_name, out_file_name, tokenizer_name)
+    out_file_names = [f"{directory_name}/{Parameters.get_model_name(tokenizer_name)}.txt" for tokenizer_name in Names.TOKENIZER_NAMES]
+    with ProcessPoolExecutor(max_workers=min(workers, len(Names.TOKENIZER_NAMES))) as executor:
+        futures = [
+            executor.submit(run_document, in_file_name, out_file_name, tokenizer_name, check)
+            for out_file_name, tokenizer_name in zip(out_file_names, Names.TOKENIZER_NAMES)
+        ]
+        for future in futures:
+            future.result()
 
 
 if __name__ == "__main__":
-    run_directory("../corpora/sentences", "sentences.txt")
-    run_directory("../corpora/words", "words.txt")
+    parser = argparse.ArgumentParser(description="Write the expected output of all tokenizers for the test corpora.")
+    parser.add_argument("--check", action="store_true", help="also tokenize whole lines and print any differences to the tokenized words")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    run_directory("../corpora/sentences", "sentences.txt", args.check, args.workers)
+    run_directory("../corpora/words", "words.txt", args.check, args.workers)
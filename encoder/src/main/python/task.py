@@ -3,10 +3,14 @@
 
 import pandas as pd
 
+from clu_profiler import CluProfiler
 from data_wrangler import DataWrangler
 from dataclasses import dataclass
-from transformers import AutoTokenizer
-from typing import Dict, List
+from functools import cached_property
+from typing import Dict, List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from transformers import AutoTokenizer
 
 @dataclass
 class LongTaskDef:
@@ -15,7 +19,7 @@ class LongTaskDef:
     train_file_name: str
     dev_file_name: str
     test_file_name: str
-    tokenizer: AutoTokenizer
+    tokenizer: "AutoTokenizer"
     dual_mode: bool = False
 
 @dataclass
@@ -27,7 +31,7 @@ class ShortTaskDef:
     test_file_name: str
     dual_mode: bool = False
 
-    def to_long_task_def(self, task_id: int, global_base_dir: str, tokenizer: AutoTokenizer) -> LongTaskDef:
+    def to_long_task_def(self, task_id: int, global_base_dir: str, tokenizer: "AutoTokenizer") -> LongTaskDef:
         base_dir = f"{global_base_dir}{self.local_base_dir}"
         return LongTaskDef(
             task_id,
@@ -40,25 +44,58 @@ class ShortTaskDef:
         )
 
 class Task:
+    # The splits are only read when they are first used, so that a process pays only for the data it needs.
     def __init__(self, long_task_def: LongTaskDef) -> None:
         self.task_id: int = long_task_def.task_id
         self.task_name: str = long_task_def.task_name
         self.dual_mode: bool = long_task_def.dual_mode
-        # we need an index of labels first
-        self.labels: List[str] = DataWrangler.read_label_set(long_task_def.train_file_name)
-        self.index_to_label: Dict[int, str] = {i: t for i, t in enumerate(self.labels)} 
-        self.label_to_index: Dict[str, int] = {t: i for i, t in enumerate(self.labels)} 
-        self.num_labels: int = len(self.index_to_label)
-        # create data frames for the datasets
-        self.train_df: pd.DataFrame = DataWrangler.read_dataframe(long_task_def.train_file_name, self.label_to_index, self.task_id, long_task_def.tokenizer)
-        self.dev_df: pd.DataFrame = DataWrangler.read_dataframe(long_task_def.dev_file_name, self.label_to_index, self.task_id, long_task_def.tokenizer)
-        self.test_df: pd.DataFrame = DataWrangler.read_dataframe(long_task_def.test_file_name, self.label_to_index, self.task_id, long_task_def.tokenizer)
+        self.long_task_def: LongTaskDef = long_task_def
+
+    # we need an index of labels first
+    # the training file is streamed for them, so that processes that never build train_df do not hold its sentences
+    # train_df sets them from its own pass over the file, so they are only streamed when they are needed first
+    @cached_property
+    def labels(self) -> List[str]:
+        with CluProfiler.span("task_load", task=self.task_name, split="labels"):
+            return DataWrangler.read_label_set(self.long_task_def.train_file_name)
+
+    @cached_property
+    def index_to_label(self) -> Dict[int, str]:
+        return {i: t for i, t in enumerate(self.labels)}
+
+    @cached_property
+    def label_to_index(self) -> Dict[str, int]:
+        return {t: i for i, t in enumerate(self.labels)}
 
+    @cached_property
+    def num_labels(self) -> int:
+        return len(self.index_to_label)
+
+    # create data frames for the datasets
+    @cached_property
+    def train_df(self) -> pd.DataFrame:
+        with CluProfiler.span("task_load", task=self.task_name, split="train"):
+            train_df, labels = DataWrangler.read_cached_train_dataframe(self.long_task_def.train_file_name, self.task_id, self.long_task_def.tokenizer)
+        # this is where the cached_property keeps its value
+        self.__dict__.setdefault("labels", labels)
         print(f"DF for task {self.task_id}")
-        print(self.train_df)
-                
+        print(train_df)
+        return train_df
+
+    @cached_property
+    def dev_df(self) -> pd.DataFrame:
+        label_to_index = self.label_to_index
+        with CluProfiler.span("task_load", task=self.task_name, split="dev"):
+            return DataWrangler.read_cached_dataframe(self.long_task_def.dev_file_name, label_to_index, self.task_id, self.long_task_def.tokenizer)
+
+    @cached_property
+    def test_df(self) -> pd.DataFrame:
+        label_to_index = self.label_to_index
+        with CluProfiler.span("task_load", task=self.task_name, split="test"):
+            return DataWrangler.read_cached_dataframe(self.long_task_def.test_file_name, label_to_index, self.task_id, self.long_task_def.tokenizer)
+
     @classmethod
-    def mk_tasks(cls, global_base_dir: str, tokenizer: AutoTokenizer, short_task_defs: List[ShortTaskDef]) -> List["Task"]:
+    def mk_tasks(cls, global_base_dir: str, tokenizer: "AutoTokenizer", short_task_defs: List[ShortTaskDef]) -> List["Task"]:
         return [
             Task(short_task_def.to_long_task_def(index, global_base_dir, tokenizer)) \
             for index, short_task_def in enumerate(short_task_defs)
@@ -0,0 +1,46 @@
+import numpy as np
+import torch
+
+from annotator import Annotator
+from export_reader import ExportReader
+from test_token_classifier import mk_model, tasks
+from tokenizer_registry import TokenizerRegistry
+
+sentences = [
+    ["John", "Smith", "lives", "in", "Tucson", "."],
+    ["Supercalifragilisticexpialidocious", "!"],
+    ["A"]
+]
+
+def test_annotate(tmp_path) -> None:
+    tokenizer = TokenizerRegistry.get("bert-base-cased")
+    model = mk_model(f"{tmp_path}/encoder", tokenizer.vocab_size)
+    export_dir = f"{tmp_path}/export"
+    for task in tasks:
+        model.export_task(model.output_heads[str(task.task_id)], task, f"{export_dir}/tasks/{task.task_id}", task.task_id % 2 == 1)
+    # these are the files of a checkpoint that Annotator.load reads
+    checkpoint_dir = f"{tmp_path}/checkpoint"
+    model.config.save_pretrained(checkpoint_dir)
+    torch.save(model.state_dict(), f"{checkpoint_dir}/pytorch_model.bin")
+
+    assert ExportReader.read_tasks(export_dir) == tasks
+    for task in tasks:
+        weights, biases = ExportReader.read_weights(f"{export_dir}/tasks/{task.task_id}")
+        linear = model.output_heads[str(task.task_id)].classifier[1]
+        assert np.array_equal(weights, linear.weight.detach().numpy())
+        assert np.array_equal(biases, linear.bias.detach().numpy())
+
+    annotator = Annotator.load(checkpoint_dir, export_dir, tokenizer, f"{tmp_path}/encoder")
+    # dual-mode tasks need head positions, so they are skipped
+    assert [task.task_name for task in annotator.tasks] == ["POS", "NER"]
+    model.eval()
+    for sentence, labels in annotator.annotate(sentences):
+        token_input = tokenizer(sentence, is_split_into_words=True, return_tensors="pt")
+        word_ids = token_input.word_ids()
+        first_tokens = [word_ids.index(word_index) for word_index in range(len(sentence))]
+        with torch.no_grad():
+            sequence_output = model.encoder(token_input["input_ids"])[0]
+        for task, task_labels in zip(annotator.tasks, labels):
+            logits, _ = model.output_heads[str(task.task_id)].forward(sequence_output, None, None)
+            predictions = torch.argmax(logits[0], dim=-1).tolist()
+            assert task_labels == [task.labels[predictions[first_token]] for first_token in first_tokens]
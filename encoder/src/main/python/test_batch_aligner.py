@@ -0,0 +1,46 @@
+import pytest
+import random
+
+from batch_aligner import BatchAligner
+from data_wrangler import DataWrangler
+from parameters import Parameters
+from typing import List, Optional
+
+labels = ["B", "I", "O"]
+label_to_index = {label: index for index, label in enumerate(labels)}
+
+def mk_word_ids(word_count: int, rng: random.Random) -> List[Optional[int]]:
+    word_ids: List[Optional[int]] = [None]
+    for word_id in range(word_count):
+        word_ids.extend([word_id] * rng.randint(1, 3))
+    word_ids.append(None)
+    return word_ids
+
+def test_align() -> None:
+    rng = random.Random(1234)
+    word_counts = [rng.randint(0, 12) for _ in range(50)]
+    word_ids_batch = [mk_word_ids(word_count, rng) for word_count in word_counts]
+    word_labels_batch = [[rng.choice(labels) for _ in range(word_count)] for word_count in word_counts]
+    # every other sentence comes without heads
+    word_heads_batch = [
+        [rng.randint(-1, word_count - 1) for _ in range(word_count)] if index % 2 == 0 else []
+        for index, word_count in enumerate(word_counts)
+    ]
+    label_ids_batch, head_positions_batch = BatchAligner.align(word_ids_batch, word_labels_batch, word_heads_batch, label_to_index)
+
+    for word_ids, word_labels, word_heads, label_ids, head_positions in \
+            zip(word_ids_batch, word_labels_batch, word_heads_batch, label_ids_batch, head_positions_batch):
+        assert label_ids == DataWrangler.align_labels(word_ids, word_labels, label_to_index)
+        if word_heads:
+            assert head_positions == DataWrangler.align_head_positions(word_ids, word_heads)
+        else:
+            assert head_positions == [Parameters.ignore_index] * len(word_ids)
+
+def test_align_unknown_label() -> None:
+    with pytest.raises(Exception, match="Can not find index for label X!"):
+        BatchAligner.align([[None, 0, None]], [["X"]], [[]], label_to_index)
+
+
+if __name__ == "__main__":
+    test_align()
+    test_align_unknown_label()
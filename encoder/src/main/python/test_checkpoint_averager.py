@@ -0,0 +1,52 @@
+import os
+import torch
+
+from checkpoint_averager import CheckpointAverager
+from test_token_classifier import mk_model
+from torch import Tensor
+from typing import Dict, List
+
+# what AveragingTrainer did before the streaming: load all the checkpoints, add them up in place, and divide,
+# except for the LongTensors, which are kept from the first checkpoint
+def average_all(state_dicts: List[Dict[str, Tensor]]) -> Dict[str, Tensor]:
+    averages = {key: value.clone() for key, value in state_dicts[0].items()}
+    for state_dict in state_dicts[1:]:
+        for key, value in averages.items():
+            if value.type() != "torch.LongTensor":
+                value += state_dict[key]
+    for value in averages.values():
+        if value.type() != "torch.LongTensor":
+            value /= len(state_dicts)
+    return averages
+
+def test_average(tmp_path) -> None:
+    model = mk_model(f"{tmp_path}/encoder")
+    checkpoint_dirs = [f"{tmp_path}/checkpoint-{index}" for index in range(3)]
+    state_dicts = []
+    for index, checkpoint_dir in enumerate(checkpoint_dirs):
+        state_dict = {key: value + torch.randn_like(value) * 0.01 for key, value in model.state_dict().items()}
+        # a buffer that is not floating point and differs between the checkpoints
+        state_dict["steps"] = torch.tensor([index * 100, index], dtype=torch.long)
+        # one checkpoint is stored in half precision, which the averaging must cope with
+        if index == 1:
+            state_dict = {key: value.half() if value.is_floating_point() else value for key, value in state_dict.items()}
+        os.makedirs(checkpoint_dir)
+        torch.save(state_dict, f"{checkpoint_dir}/pytorch_model.bin")
+        state_dicts.append(state_dict)
+
+    averages = CheckpointAverager.average(checkpoint_dirs)
+    # the old way adds into the first checkpoint, so the dtypes are those of the first one
+    expected = average_all(state_dicts)
+    assert averages.keys() == expected.keys()
+    for key, value in expected.items():
+        assert averages[key].dtype == value.dtype
+        torch.testing.assert_close(averages[key], value)
+    assert averages["steps"].tolist() == [0, 0]
+
+    # a half precision first checkpoint is averaged in float32 and converted back at the end
+    half_averages = CheckpointAverager.average(checkpoint_dirs[1:] + checkpoint_dirs[:1])
+    for key, value in expected.items():
+        if value.is_floating_point():
+            assert half_averages[key].dtype == torch.float16
+            torch.testing.assert_close(half_averages[key], value.half(), atol=1e-3, rtol=1e-3)
+    assert half_averages["steps"].tolist() == [100, 1]
@@ -0,0 +1,79 @@
+import json
+import os
+import pytest
+import torch
+
+from checkpoint_evaluator import CheckpointEvaluator, CheckpointScores
+from evaluator import Evaluator
+from export_reader import ExportedTask
+from parameters import Parameters
+from task import LongTaskDef, Task
+from test_token_classifier import mk_model
+from tokenizer_registry import TokenizerRegistry
+from typing import List
+
+conll = "John\tNNP\nlives\tVBZ\nin\tIN\nTucson\tNNP\n.\t.\n\nIt\tPRP\nrains\tVBZ\n.\t.\n\n"
+
+def mk_tasks(data_dir: str) -> List[Task]:
+    file_name = f"{data_dir}/pos.txt"
+    with open(file_name, "w", encoding=Parameters.encoding) as file:
+        file.write(conll)
+    tokenizer = TokenizerRegistry.get("bert-base-cased")
+    return [Task(LongTaskDef(0, "POS", file_name, file_name, file_name, tokenizer))]
+
+def test_scores(tmp_path) -> None:
+    checkpoint_dir = str(tmp_path)
+    tasks = [ExportedTask(0, "POS", [], False), ExportedTask(1, "NER", [], False)]
+    assert CheckpointScores.read(checkpoint_dir, tasks) is None
+    CheckpointScores.write(checkpoint_dir, {"POS": 0.75, "NER": 0.25})
+    assert CheckpointScores.read(checkpoint_dir, tasks) == {"POS": 0.75, "NER": 0.25}
+    with open(CheckpointScores.get_file_name(checkpoint_dir), encoding=Parameters.encoding) as file:
+        assert json.load(file)["macro_accuracy"] == 0.5
+    # scores for another set of tasks do not count
+    assert CheckpointScores.read(checkpoint_dir, tasks[:1]) is None
+
+# the settings of the parent win over the defaults that were bound when the worker imported its modules
+def test_init_worker(tmp_path, monkeypatch) -> None:
+    tokenizer = TokenizerRegistry.get("bert-base-cased")
+    tasks = mk_tasks(str(tmp_path))
+    model = mk_model(f"{tmp_path}/encoder", tokenizer.vocab_size, tasks)
+    monkeypatch.setattr(Parameters, "transformer_name", f"{tmp_path}/encoder")
+    settings = Parameters.get_settings()
+    settings["eval_max_batch_tokens"] = 7
+    monkeypatch.setattr(CheckpointEvaluator, "evaluator", None)
+    monkeypatch.setattr(CheckpointEvaluator, "tasks", [])
+    monkeypatch.setattr(Parameters, "eval_max_batch_tokens", Parameters.eval_max_batch_tokens)
+    num_threads = torch.get_num_threads()
+    try:
+        CheckpointEvaluator.init_worker(settings, model.config, [task.long_task_def for task in tasks], 1)
+    finally:
+        torch.set_num_threads(num_threads)
+    assert CheckpointEvaluator.evaluator is not None
+    assert CheckpointEvaluator.evaluator.max_batch_tokens == 7
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_evaluate(tmp_path, monkeypatch, workers: int) -> None:
+    tokenizer = TokenizerRegistry.get("bert-base-cased")
+    encoder_dir = f"{tmp_path}/encoder"
+    tasks = mk_tasks(str(tmp_path))
+    model = mk_model(encoder_dir, tokenizer.vocab_size, tasks)
+    # the spawned workers build their models from these settings, which they get from this process
+    monkeypatch.setattr(Parameters, "transformer_name", encoder_dir)
+    monkeypatch.setattr(Parameters, "cache_dir", f"{tmp_path}/cache")
+
+    checkpoint_dirs = [f"{tmp_path}/checkpoint-{index}" for index in range(3)]
+    for checkpoint_dir in checkpoint_dirs:
+        os.makedirs(checkpoint_dir)
+        torch.save(model.state_dict(), f"{checkpoint_dir}/pytorch_model.bin")
+    # this score was not computed from the checkpoint, so it shows that the checkpoint was skipped
+    CheckpointScores.write(checkpoint_dirs[0], {"POS": 0.125})
+
+    all_accuracies = CheckpointEvaluator.evaluate(model, model.config, tasks, checkpoint_dirs, workers)
+    accuracy = Evaluator(model).evaluate_tasks(tasks)[tasks[0].task_name]
+    assert all_accuracies == {
+        checkpoint_dirs[0]: {"POS": 0.125},
+        checkpoint_dirs[1]: {"POS": accuracy},
+        checkpoint_dirs[2]: {"POS": accuracy}
+    }
+    for checkpoint_dir in checkpoint_dirs[1:]:
+        assert CheckpointScores.read(checkpoint_dir, tasks) == {"POS": accuracy}
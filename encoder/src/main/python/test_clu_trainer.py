@@ -1,6 +1,10 @@
+import pytest
+
 from clu_tokenizer import CluTokenizer
 from clu_trainer import CluTrainer
+from parameters import Parameters
 from task import ShortTaskDef, Task
+from tokenizer_registry import TokenizerRegistry
 
 def test_true() -> None:
     assert True == True
@@ -9,6 +13,8 @@ def test_false() -> None:
     assert False != True
 
 def test_clu_trainer() -> None:
+    if not TokenizerRegistry.is_available(Parameters.transformer_name):
+        pytest.skip(f"The tokenizer named \"{Parameters.transformer_name}\" is not bundled, and the hub is offline.")
     tokenizer = CluTokenizer.get_pretrained()
     tasks = Task.mk_tasks("data/", tokenizer, [
         ShortTaskDef("NER",       "conll-ner/", "train_small.txt",    "train_small.txt",  "train_small.txt"),
@@ -0,0 +1,57 @@
+import torch
+
+from datasets import Dataset
+from evaluator import Evaluator
+from length_batcher import LengthBatcher
+from names import Names
+from parameters import Parameters
+from task import LongTaskDef, Task
+from test_token_classifier import mk_model
+from tokenizer_registry import TokenizerRegistry
+from typing import Dict, List
+
+# sentences of different lengths so that they end up in several batches with padding
+conll = "".join(
+    "".join(f"{word}\t{label}\n" for word, label in sentence) + "\n"
+    for sentence in [
+        [("John", "NNP"), ("lives", "VBZ"), ("in", "IN"), ("Tucson", "NNP"), (".", ".")],
+        [("It", "PRP"), ("rains", "VBZ"), (".", ".")],
+        [("Mary", "NNP"), ("and", "CC"), ("John", "NNP"), ("visited", "VBD"), ("the", "DT"), ("supercalifragilistic", "JJ"), ("museum", "NN"), (".", ".")],
+        [("Yes", "UH")],
+        [("Tucson", "NNP"), ("is", "VBZ"), ("hot", "JJ"), ("in", "IN"), ("July", "NNP"), (".", ".")]
+    ]
+)
+
+def mk_task(data_dir: str) -> Task:
+    file_name = f"{data_dir}/pos.txt"
+    with open(file_name, "w", encoding=Parameters.encoding) as file:
+        file.write(conll)
+    return Task(LongTaskDef(0, "POS", file_name, file_name, file_name, TokenizerRegistry.get("bert-base-cased")))
+
+# the predictions of the padded batches, for each row of the dev dataframe, without the padding
+def predict_batched(evaluator: Evaluator, task: Task) -> List[int]:
+    assert evaluator.max_batch_tokens is not None
+    lengths = [len(input_ids) for input_ids in task.dev_df[Names.INPUT_IDS].tolist()]
+    row_indexes = [index for batch in LengthBatcher.mk_batches(lengths, evaluator.max_batch_tokens) for index in batch]
+    batches = evaluator.get_batches(task, False)
+    assert len(batches) > 1
+    row_predictions: Dict[int, List[int]] = {}
+    with torch.no_grad():
+        for batch in batches:
+            for predictions in evaluator.predict_batch(batch).tolist():
+                row_index = row_indexes[len(row_predictions)]
+                row_predictions[row_index] = predictions[:lengths[row_index]]
+    return [prediction for row_index in range(len(lengths)) for prediction in row_predictions[row_index]]
+
+def test_batched_matches_unbatched(tmp_path) -> None:
+    task = mk_task(str(tmp_path))
+    model = mk_model(f"{tmp_path}/encoder", TokenizerRegistry.get("bert-base-cased").vocab_size, [task])
+    unbatched_evaluator = Evaluator(model, max_batch_tokens=None)
+    batched_evaluator = Evaluator(model, max_batch_tokens=32)
+
+    unbatched_accuracies = unbatched_evaluator.evaluate_tasks([task])
+    batched_accuracies = batched_evaluator.evaluate_tasks([task])
+    assert batched_accuracies == unbatched_accuracies
+
+    _, unbatched_predictions = unbatched_evaluator.predict(Dataset.from_pandas(task.dev_df))
+    assert predict_batched(batched_evaluator, task) == unbatched_predictions
@@ -0,0 +1,31 @@
+import numpy as np
+import os
+import tempfile
+
+from head_format import HeadFormat
+
+def test_binary_round_trip() -> None:
+    rng = np.random.default_rng(1234)
+    weights = rng.normal(0, 0.02, size=(7, 16)).astype(np.float32)
+    biases = rng.normal(0, 0.02, size=7).astype(np.float32)
+    labels = ["B-LOC", "B-ORG", "B-PER", "I-LOC", "I-ORG", "I-PER", "O"]
+    with tempfile.TemporaryDirectory() as task_dir:
+        HeadFormat.write_text(task_dir, weights, biases, labels)
+        binary_name = f"{task_dir}/{HeadFormat.binary_name}"
+        HeadFormat.write_binary(binary_name, "NER", False, weights, biases, labels)
+
+        text_weights, text_biases, text_labels = HeadFormat.read_text(task_dir)
+        for mmap in [True, False]:
+            header, binary_weights, binary_biases = HeadFormat.read_binary(binary_name, mmap)
+            assert header["task_name"] == "NER"
+            assert header["dual"] == False
+            assert header["labels"] == text_labels == labels
+            # the text format prints each float32 exactly, so both formats must agree bit for bit
+            assert np.array_equal(binary_weights, text_weights)
+            assert np.array_equal(binary_biases, text_biases)
+            assert np.array_equal(binary_weights, weights)
+        assert os.path.getsize(binary_name) < os.path.getsize(f"{task_dir}/weights")
+
+
+if __name__ == "__main__":
+    test_binary_round_trip()
@@ -0,0 +1,15 @@
+from length_batcher import LengthBatcher
+
+def test_mk_batches() -> None:
+    lengths = [5, 1, 3, 3, 9, 2]
+    batches = LengthBatcher.mk_batches(lengths, 9)
+    assert batches == [[1, 5, 2], [3], [0], [4]]
+    # every item is used exactly once
+    assert sorted(index for batch in batches for index in batch) == list(range(len(lengths)))
+
+def test_mk_batches_oversized() -> None:
+    assert LengthBatcher.mk_batches([20, 4], 8) == [[1], [0]]
+
+
+if __name__ == "__main__":
+    test_mk_batches()
@@ -0,0 +1,29 @@
+import onnx
+import pytest
+
+from onnx_export import OnnxExport
+from test_token_classifier import mk_model, tasks
+from tokenizer_registry import TokenizerRegistry
+
+pytest.importorskip("onnxruntime")
+
+def test_export_encoder(tmp_path) -> None:
+    tokenizer = TokenizerRegistry.get("bert-base-cased")
+    model = mk_model(f"{tmp_path}/encoder", tokenizer.vocab_size)
+    file_name = f"{tmp_path}/encoder.onnx"
+    OnnxExport.export_encoder(model.encoder, tokenizer, file_name, "cpu")
+    assert [graph_input.name for graph_input in onnx.load(file_name).graph.input] == [OnnxExport.TOKEN_IDS, OnnxExport.ATTENTION_MASK, OnnxExport.TOKEN_TYPE_IDS]
+    # this raises if onnxruntime and PyTorch disagree on any of the batch shapes
+    OnnxExport.check_encoder(model.encoder, file_name)
+
+@pytest.mark.parametrize("argmax", [False, True])
+def test_export_model(tmp_path, argmax: bool) -> None:
+    tokenizer = TokenizerRegistry.get("bert-base-cased")
+    model = mk_model(f"{tmp_path}/encoder", tokenizer.vocab_size)
+    file_name = f"{tmp_path}/model.onnx"
+    OnnxExport.export_model(model, tasks, tokenizer, file_name, "cpu", argmax)
+    graph = onnx.load(file_name).graph
+    # one of the tasks is dual-mode, so the head positions are needed
+    assert graph.input[-1].name == OnnxExport.HEAD_POSITIONS
+    assert [graph_output.name for graph_output in graph.output] == OnnxExport.get_output_names(tasks, argmax)
+    OnnxExport.check_model(model, tasks, file_name, argmax)
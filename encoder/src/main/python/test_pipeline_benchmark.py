@@ -0,0 +1,25 @@
+import json
+
+from parameters import Parameters
+from pipeline_benchmark import CorpusConfig, PipelineBenchmark
+from tokenizer_registry import TokenizerRegistry
+
+def test_run(tmp_path) -> None:
+    tokenizer = TokenizerRegistry.get("bert-base-cased")
+    config = CorpusConfig(num_sentences=20, num_labels=3, mean_length=5.0, max_length=12, vocabulary_size=50)
+    measurements = PipelineBenchmark.run(tokenizer, config, str(tmp_path), batch_size=8)
+    assert [measurement["stage"] for measurement in measurements] == [
+        "read_label_set(synthetic.txt)", "read_dataframe(synthetic.txt)",
+        "read_label_set(synthetic.heads)", "read_dataframe(synthetic.heads)",
+        "align_labels", "align_head_positions", "BatchAligner.align",
+        "Dataset.from_pandas", "DualDataCollator.torch_call(batch_size=8)"
+    ]
+    assert all(measurement["peak_bytes"] > 0 for measurement in measurements)
+    assert measurements[1]["items"] == 20
+
+    file_name = f"{tmp_path}/results.json"
+    PipelineBenchmark.write_results(file_name, tokenizer, config, measurements)
+    with open(file_name, encoding=Parameters.encoding) as file:
+        results = json.load(file)
+    assert results["corpus"]["seed"] == CorpusConfig.default_seed
+    assert len(results["measurements"]) == len(measurements)
@@ -0,0 +1,43 @@
+import pytest
+
+from file_utils import FileUtils
+from io import TextIOWrapper
+from parameters import Parameters
+from task import LongTaskDef, Task
+from test_checkpoint_evaluator import conll
+from tokenizer_registry import TokenizerRegistry
+from typing import List, Optional
+
+def mk_task(file_name: str) -> Task:
+    return Task(LongTaskDef(0, "POS", file_name, file_name, file_name, TokenizerRegistry.get("bert-base-cased")))
+
+# the training file is read only once for both the dataframe and the labels, and not at all when it is cached
+@pytest.mark.parametrize("cache_dir", [None, "cache"])
+def test_train_df(tmp_path, monkeypatch, cache_dir: Optional[str]) -> None:
+    file_name = f"{tmp_path}/pos.txt"
+    with open(file_name, "w", encoding=Parameters.encoding) as file:
+        file.write(conll)
+    monkeypatch.setattr(Parameters, "cache_dir", f"{tmp_path}/{cache_dir}" if cache_dir is not None else None)
+    reads: List[str] = []
+    for_reading = FileUtils.for_reading
+
+    def count_reading(name: str) -> TextIOWrapper:
+        reads.append(name)
+        return for_reading(name)
+
+    monkeypatch.setattr(FileUtils, "for_reading", count_reading)
+
+    task = mk_task(file_name)
+    train_df = task.train_df
+    assert task.labels == [".", "IN", "NNP", "PRP", "VBZ"]
+    assert reads == [file_name]
+    assert len(train_df) == 2
+
+    task = mk_task(file_name)
+    assert task.train_df[task.train_df.columns[0]].tolist() == train_df[train_df.columns[0]].tolist()
+    assert task.labels == [".", "IN", "NNP", "PRP", "VBZ"]
+    assert reads == [file_name] * (1 if cache_dir is not None else 2)
+
+    # without train_df, the labels are streamed
+    task = mk_task(file_name)
+    assert task.label_to_index == {".": 0, "IN": 1, "NNP": 2, "PRP": 3, "VBZ": 4}
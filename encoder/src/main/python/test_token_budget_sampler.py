@@ -0,0 +1,19 @@
+import random
+
+from token_budget_sampler import TokenBudgetBatchSampler
+
+def test_token_budget_batch_sampler() -> None:
+    rng = random.Random(1234)
+    lengths = [rng.randint(3, 120) for _ in range(500)]
+    sampler = TokenBudgetBatchSampler(lengths, 1024, seed=42)
+    epochs = [list(sampler), list(sampler)]
+    # batches are shuffled differently from epoch to epoch
+    assert epochs[0] != epochs[1]
+    for batches in epochs:
+        assert len(batches) == len(sampler)
+        assert sorted(index for batch in batches for index in batch) == list(range(len(lengths)))
+        assert all(max(lengths[index] for index in batch) * len(batch) <= 1024 for batch in batches)
+
+
+if __name__ == "__main__":
+    test_token_budget_batch_sampler()
@@ -0,0 +1,41 @@
+import torch
+
+from export_reader import ExportedTask
+from task import Task
+from token_classifier import TokenClassificationModel
+from transformers import AutoConfig, BertConfig, BertModel
+from typing import Sequence, Union
+
+tasks = [
+    ExportedTask(0, "POS", ["A", "B", "C"], False),
+    ExportedTask(1, "NER", ["X", "Y"], False),
+    ExportedTask(2, "Deps", ["L", "R", "M", "N"], True)
+]
+
+# a tiny, randomly initialized encoder so that no pretrained model needs to be downloaded
+def mk_model(model_dir: str, vocab_size: int = 100, model_tasks: Sequence[Union[Task, ExportedTask]] = tasks) -> TokenClassificationModel:
+    torch.manual_seed(1234)
+    BertModel(BertConfig(vocab_size=vocab_size, hidden_size=16, num_hidden_layers=1, num_attention_heads=2, intermediate_size=32)).save_pretrained(model_dir)
+    return TokenClassificationModel(AutoConfig.from_pretrained(model_dir), model_dir).add_heads(model_tasks)
+
+def test_fused_heads(tmp_path) -> None:
+    model = mk_model(str(tmp_path))
+    input_ids = torch.randint(1, 100, (3, 7))
+    head_positions = torch.randint(0, 7, (3, 7))
+    all_logits = model.predict_all_tasks(input_ids, head_positions=head_positions)
+    fused_heads = model.fused_heads[False]
+    # the fused weights are reused by later batches
+    assert model.predict_all_tasks(input_ids, head_positions=head_positions).keys() == all_logits.keys()
+    assert model.fused_heads[False] is fused_heads
+
+    with torch.no_grad():
+        sequence_output = model.encoder(input_ids)[0]
+        for task in tasks:
+            logits, _ = model.output_heads[str(task.task_id)].forward(sequence_output, None, head_positions)
+            assert torch.allclose(all_logits[task.task_id], logits, atol=1e-6)
+
+    # changed weights must not be served from the stale fused copy
+    model.train()
+    with torch.no_grad():
+        model.output_heads["0"].classifier[1].bias.add_(1.0)
+    assert torch.allclose(model.predict_all_tasks(input_ids)[0], all_logits[0] + 1.0, atol=1e-5)
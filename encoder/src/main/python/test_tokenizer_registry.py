@@ -0,0 +1,28 @@
+from names import Names
+from parameters import Parameters
+from tokenizer_registry import TokenizerRegistry
+
+words_dir = f"{TokenizerRegistry.resource_dir}/../../../../../../test/resources/words"
+
+def test_get_memoizes() -> None:
+    tokenizer = TokenizerRegistry.get("bert-base-cased")
+    assert TokenizerRegistry.get("bert-base-cased") is tokenizer
+    assert TokenizerRegistry.get("bert-base-cased", True) is not tokenizer
+
+# the bundled tokenizers must reproduce the expected output that was made with the pretrained ones
+def test_bundled_tokenizers() -> None:
+    for name in Names.TOKENIZER_NAMES:
+        if not TokenizerRegistry.is_bundled(name):
+            continue
+        tokenizer = TokenizerRegistry.get(name)
+        with open(f"{words_dir}/{Parameters.get_model_name(name)}.txt", encoding=Parameters.encoding) as file:
+            lines = [line.rstrip("\n") for line in file]
+        for line, tokens, ids in zip(lines[0::3], lines[1::3], lines[2::3]):
+            input_ids = tokenizer(line.split(" "), is_split_into_words=True).input_ids
+            assert str(input_ids) == ids
+            assert str(tokenizer.convert_ids_to_tokens(input_ids)) == tokens
+
+
+if __name__ == "__main__":
+    test_get_memoizes()
+    test_bundled_tokenizers()
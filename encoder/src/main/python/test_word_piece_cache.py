@@ -0,0 +1,39 @@
+from names import Names
+from parameters import Parameters
+from tokenizer_registry import TokenizerRegistry
+from typing import List
+from word_piece_cache import WordPieceCache
+
+resources_dir = f"{TokenizerRegistry.resource_dir}/../../../../../../test/resources"
+
+def read_sentences(file_name: str) -> List[List[str]]:
+    with open(file_name, encoding=Parameters.encoding) as file:
+        return [line.strip().split(" ") for line in file if line.strip()]
+
+# the cache must reproduce the tokenizer exactly, even when it is too small to hold all the words
+def test_equivalence() -> None:
+    sentences = read_sentences(f"{resources_dir}/words/words.txt") + read_sentences(f"{resources_dir}/sentences/sentences.txt")
+    for name in Names.TOKENIZER_NAMES:
+        if not TokenizerRegistry.is_bundled(name):
+            continue
+        tokenizer = TokenizerRegistry.get(name)
+        word_piece_cache = WordPieceCache.mk(tokenizer, 1000)
+        if word_piece_cache is None:
+            continue
+        for start in range(0, len(sentences), Parameters.tokenizer_batch_size):
+            batch = sentences[start:start + Parameters.tokenizer_batch_size]
+            token_input = tokenizer(batch, is_split_into_words=True)
+            input_ids_batch, word_ids_batch = word_piece_cache.tokenize(batch)
+            assert input_ids_batch == token_input[Names.INPUT_IDS]
+            assert word_ids_batch == [token_input.word_ids(batch_index=batch_index) for batch_index in range(len(batch))]
+        assert len(word_piece_cache.word_pieces) == 1000
+
+def test_fallback() -> None:
+    assert WordPieceCache.mk(TokenizerRegistry.get("bert-base-cased"), 10) is not None
+    assert WordPieceCache.mk(TokenizerRegistry.get("roberta-base"), 10) is None
+    assert WordPieceCache.mk(TokenizerRegistry.get("roberta-base", False), 10) is None
+
+
+if __name__ == "__main__":
+    test_equivalence()
+    test_fallback()
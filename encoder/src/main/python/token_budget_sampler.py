@@ -0,0 +1,33 @@
+import random
+
+from length_batcher import LengthBatcher
+from torch.utils.data import Sampler
+from typing import Iterator, List
+
+# A batch sampler that groups examples of similar length and fills each batch up to a maximum
+# number of (padded) tokens rather than a fixed number of sentences.  Each epoch, examples of the
+# same length are visited in a different order and the resulting batches are shuffled.
+class TokenBudgetBatchSampler(Sampler[List[int]]):
+    def __init__(self, lengths: List[int], max_tokens: int, seed: int = 0) -> None:
+        self.lengths = lengths
+        self.max_tokens = max_tokens
+        self.seed = seed
+        # incremented on every pass so that each epoch is shuffled differently
+        self.epoch = 0
+
+    def __iter__(self) -> Iterator[List[int]]:
+        rng = random.Random(self.seed + self.epoch)
+        self.epoch += 1
+        # shuffling before the (stable) sort by length breaks ties randomly
+        permutation = list(range(len(self.lengths)))
+        rng.shuffle(permutation)
+        batches = [
+            [permutation[index] for index in batch]
+            for batch in LengthBatcher.mk_batches([self.lengths[index] for index in permutation], self.max_tokens)
+        ]
+        rng.shuffle(batches)
+        return iter(batches)
+
+    # the batch boundaries only depend on the sorted lengths, so the count is the same for every epoch
+    def __len__(self) -> int:
+        return len(LengthBatcher.mk_batches(self.lengths, self.max_tokens))
@@ -4,19 +4,29 @@
 import os
 import torch
 
-from file_utils import FileUtils
+from clu_profiler import CluProfiler
+from dataclasses import dataclass
+from export_reader import ExportedTask
+from head_format import HeadFormat
 from names import Names
-from tensor_filter import TensorFilter
+from onnx_export import OnnxExport
 from parameters import Parameters
 from task import Task
 from torch import nn, Tensor
 from transformers import AutoConfig, AutoModel, AutoTokenizer, PreTrainedModel
 from transformers.modeling_outputs import TokenClassifierOutput
-from typing import Any, Callable, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 # This global variable indicates the position of the linear layer in TokenClassificationHead.classifier
 linear_pos = 1
 
+# The heads of one kind (dual mode or not) along with their linear layers stacked into a single weight and bias
+@dataclass
+class FusedHeads:
+    task_heads: List[Tuple[int, "TokenClassificationHead"]]
+    weight: Tensor
+    bias: Tensor
+
 # This class is adapted from: https://towardsdatascience.com/how-to-create-and-train-a-multi-task-transformer-model-18c54a146240
 class TokenClassificationModel(PreTrainedModel):    
     def __init__(self, config: AutoConfig, transformer_name: str) -> None:
@@ -25,8 +35,10 @@ class TokenClassificationModel(PreTrainedModel):
         self.config: AutoConfig = config
         self.output_heads: nn.ModuleDict = nn.ModuleDict() # these are initialized in add_heads
         self.training_mode: bool = True
+        # the fused heads for forward_all_heads by dual_mode, which are copies of the weights (see get_fused_heads)
+        self.fused_heads: Dict[bool, Optional[FusedHeads]] = {}
 
-    def add_heads(self, tasks: List[Task]) -> "TokenClassificationModel":
+    def add_heads(self, tasks: Sequence[Union[Task, ExportedTask]]) -> "TokenClassificationModel":
         for task in tasks:
             head = TokenClassificationHead(self.encoder.config.hidden_size, task.num_labels, task.task_id, task.dual_mode, self.config.hidden_dropout_prob)
             # ModuleDict requires keys to be strings
@@ -41,19 +53,37 @@ class TokenClassificationModel(PreTrainedModel):
             head.summarize(task_id)
 
     def _init_weights(self) -> None:
+        self.fused_heads = {}
         for head in self.output_heads.values():
             head._init_weights()
+
+    # The fused heads are copies of the weights, so they are dropped whenever the weights may change or move.
+    # In training mode, the optimizer changes the weights in place, so nothing is kept until eval() is called.
+    def train(self, mode: bool = True) -> "TokenClassificationModel":
+        if mode:
+            self.fused_heads = {}
+        return super().train(mode)
+
+    def load_state_dict(self, *args: Any, **kwargs: Any) -> Any:
+        self.fused_heads = {}
+        return super().load_state_dict(*args, **kwargs)
+
+    # this is behind to(), cpu(), cuda(), half(), and the like
+    def _apply(self, *args: Any, **kwargs: Any) -> Any:
+        self.fused_heads = {}
+        return super()._apply(*args, **kwargs)
     
     def forward(self,
         input_ids: Tensor = None, attention_mask: Tensor = None, token_type_ids: Optional[Tensor] = None,
         labels: Tensor = None, head_positions: Tensor = None, task_ids: Tensor = None, **kwargs: str
     ) -> TokenClassifierOutput:
-        outputs = self.encoder(
-            input_ids,
-            attention_mask=attention_mask,
-            token_type_ids=token_type_ids,
-            **kwargs,
-        )
+        with CluProfiler.span("encoder_forward"):
+            outputs = self.encoder(
+                input_ids,
+                attention_mask=attention_mask,
+                token_type_ids=token_type_ids,
+                **kwargs,
+            )
         sequence_output = outputs[0]
 
         #print("Keys in kwargs:")
@@ -63,46 +93,125 @@ class TokenClassificationModel(PreTrainedModel):
         #print(f"batch size = {len(input_ids)}")
         #print(f"task_ids in this batch: {task_ids}")
         
-        # generate specific predictions and losses for each task head
-        unique_task_ids = torch.unique(task_ids).tolist()
-        #print(f"Unique task ids: {unique_task_ids_list}")
-        logits = None
-        loss_list = []
-        for unique_task_id in unique_task_ids:
-            task_id_filter = TensorFilter(task_ids == unique_task_id)
-            #print(f"sequence_output = {sequence_output}")
-            #print(f"task_id_filter = {task_id_filter}")
-            filtered_sequence_output = task_id_filter.filter(sequence_output)
-            filtered_head_positions = task_id_filter.filter(head_positions)
-            filtered_labels = task_id_filter.filter(labels)
-            filtered_attention_mask = task_id_filter.filter(attention_mask)
-            #print(f"size of batch for task {unique_task_id} is: {len(filtered_sequence_output)}")
-            #print(f"running forward for task {unique_task_id}")
-            #print(f"Using task {self.output_heads[str(unique_task_id)].task_id}")
-
-            logits, task_loss = self.output_heads[str(unique_task_id)].forward(
-                filtered_sequence_output, None,
-                filtered_head_positions, 
-                filtered_labels,
-                filtered_attention_mask
-            )
-            #print(f"done forward for task {unique_task_id}")
-            if filtered_labels is not None:
-                loss_list.append(task_loss) #lost_list is empty, so loss becomes empty
-                
-        loss = None if len(loss_list) == 0 else torch.stack(loss_list).mean()
+        # logits are only used for eval, so we don't save them in training (different task dimensions confuse HF) 
+        logits, loss = self.forward_heads(self.output_heads, sequence_output, head_positions, labels, attention_mask, task_ids, not self.training_mode)
         #print("batch done")
         #print(f"logits size: {logits.size()}")
                     
-        # logits are only used for eval, so we don't save them in training (different task dimensions confuse HF) 
-        # at testing time we run one task at a time, so we need to save them then 
         return TokenClassifierOutput(
             loss=loss,
-            logits=None if self.training_mode else logits,
+            logits=logits,
             hidden_states=outputs.hidden_states,
             attentions=outputs.attentions
         )
+
+    # Generates specific predictions and losses for each task head.  The rows of the batch are sorted by task
+    # once so that each head runs on a contiguous slice (a view) of the sorted tensors.  If requested, the logits
+    # are scattered back into the original row order.  Since tasks have different numbers of labels, they are
+    # padded to the largest number in the batch with the lowest possible value so that argmax is unaffected.
+    @classmethod
+    def forward_heads(cls,
+        output_heads: nn.ModuleDict, sequence_output: Tensor, head_positions: Optional[Tensor], labels: Optional[Tensor],
+        attention_mask: Optional[Tensor], task_ids: Tensor, return_logits: bool
+    ) -> Tuple[Optional[Tensor], Optional[Tensor]]:
+        # a stable sort keeps the rows of each task in their original order
+        _, permutation = torch.sort(task_ids, stable=True)
+        # the sizes of the slices are the only values that need to be copied to the host
+        counts = torch.bincount(task_ids, minlength=len(output_heads)).tolist()
+        #print(f"Rows per task: {counts}")
+
+        def permute(tensor: Optional[Tensor]) -> Optional[Tensor]:
+            return None if tensor is None else tensor[permutation]
+
+        sorted_sequence_output = sequence_output[permutation]
+        sorted_head_positions = permute(head_positions)
+        sorted_labels = permute(labels)
+        sorted_attention_mask = permute(attention_mask)
+
+        task_heads = [(task_id, output_heads[str(task_id)]) for task_id, count in enumerate(counts) if count > 0]
+        sorted_logits = None
+        if return_logits:
+            num_labels = max(head.num_labels for _, head in task_heads)
+            sorted_logits = sequence_output.new_full(sequence_output.shape[:2] + (num_labels,), torch.finfo(sequence_output.dtype).min)
+        loss_list = []
+        start = 0
+        for task_id, head in task_heads:
+            rows = slice(start, start + counts[task_id])
+            start += counts[task_id]
+            #print(f"running forward for task {task_id} on {counts[task_id]} rows")
+            with CluProfiler.span("head_forward", task_id=task_id, rows=counts[task_id]):
+                task_logits, task_loss = head.forward(
+                    sorted_sequence_output[rows], None,
+                    None if sorted_head_positions is None else sorted_head_positions[rows],
+                    None if sorted_labels is None else sorted_labels[rows],
+                    None if sorted_attention_mask is None else sorted_attention_mask[rows]
+                )
+            if sorted_logits is not None:
+                sorted_logits[rows, :, :head.num_labels] = task_logits
+            if sorted_labels is not None:
+                loss_list.append(task_loss)
+
+        loss = None if len(loss_list) == 0 else torch.stack(loss_list).mean()
+        logits = None
+        if sorted_logits is not None:
+            logits = torch.empty_like(sorted_logits)
+            logits[permutation] = sorted_logits
+        return logits, loss
     
+    # Encodes the batch once and returns the logits of every task, keyed by task id.  This is meant for
+    # inference, so dropout is disabled.  Dual-mode heads are only included if head_positions are provided.
+    def predict_all_tasks(self,
+        input_ids: Tensor, attention_mask: Optional[Tensor] = None, token_type_ids: Optional[Tensor] = None,
+        head_positions: Optional[Tensor] = None
+    ) -> Dict[int, Tensor]:
+        self.eval()
+        with torch.no_grad():
+            outputs = self.encoder(
+                input_ids,
+                attention_mask=attention_mask,
+                token_type_ids=token_type_ids
+            )
+            return self.forward_all_heads(outputs[0], head_positions)
+
+    # Instead of running the heads one at a time, the weights of all heads that are not in dual mode are stacked
+    # into a single matrix and applied with one matmul.  The dual-mode heads, which all see the same concatenated
+    # (or summed) modifier and head states, are fused the same way in a second step.
+    def forward_all_heads(self, sequence_output: Tensor, head_positions: Optional[Tensor] = None) -> Dict[int, Tensor]:
+        logits: Dict[int, Tensor] = {}
+        single_heads = self.get_fused_heads(False)
+        if single_heads is not None:
+            logits.update(self.forward_fused_heads(single_heads, sequence_output))
+        dual_heads = self.get_fused_heads(True)
+        if dual_heads is not None and head_positions is not None:
+            dual_output = dual_heads.task_heads[0][1].concatenate(sequence_output, head_positions)
+            logits.update(self.forward_fused_heads(dual_heads, dual_output))
+        return logits
+
+    def mk_fused_heads(self, dual_mode: bool) -> Optional[FusedHeads]:
+        task_heads = [(int(task_id), head) for task_id, head in self.output_heads.items() if head.dual_mode == dual_mode]
+        if not task_heads:
+            return None
+        linears = [head.classifier[linear_pos] for _, head in task_heads]
+        return FusedHeads(task_heads, torch.cat([linear.weight for linear in linears]), torch.cat([linear.bias for linear in linears]))
+
+    # In eval mode, the weights are stacked once and then reused by every batch until the model is trained, loaded,
+    # or moved.  These copies are detached, so no gradients flow through them.  In training mode, the weights are
+    # stacked again for every batch.
+    def get_fused_heads(self, dual_mode: bool) -> Optional[FusedHeads]:
+        if self.training:
+            return self.mk_fused_heads(dual_mode)
+        if dual_mode not in self.fused_heads:
+            with torch.no_grad():
+                self.fused_heads[dual_mode] = self.mk_fused_heads(dual_mode)
+        return self.fused_heads[dual_mode]
+
+    # the logits of each task are returned as views into the output of the single fused matmul
+    @classmethod
+    def forward_fused_heads(cls, fused_heads: FusedHeads, input: Tensor) -> Dict[int, Tensor]:
+        fused_logits = nn.functional.linear(input, fused_heads.weight, fused_heads.bias)
+        task_logits = torch.split(fused_logits, [head.num_labels for _, head in fused_heads.task_heads], dim=-1)
+        return {task_id: logits for (task_id, _), logits in zip(fused_heads.task_heads, task_logits)}
+
     def save_pretrained(self,
         save_directory: str, is_main_process: bool = True, state_dict:  Optional[dict] = None, save_function: Callable = torch.save,
         push_to_hub: bool = False, max_shard_size: str = "10GB", safe_serialization: bool = False, **kwargs: str
@@ -132,7 +241,8 @@ class TokenClassificationModel(PreTrainedModel):
             self.load_state_dict(checkpoint)    
             print("Done loading.")
 
-    def export_task(self, task_head, task: Task, task_checkpoint) -> None:
+    # with binary, the weights, biases, and labels go into a single HeadFormat.binary_name file instead of text files
+    def export_task(self, task_head, task: Task, task_checkpoint, binary: bool = False) -> None:
         numpy_weights = task_head.classifier[linear_pos].weight.cpu().detach().numpy()
         numpy_bias = task_head.classifier[linear_pos].bias.cpu().detach().numpy()
         labels = task.labels
@@ -146,23 +256,11 @@ class TokenClassificationModel(PreTrainedModel):
 
         self.export_name(f"{task_checkpoint}/name", task.task_name)
         self.export_dual(f"{task_checkpoint}/dual", task.dual_mode)
-        
-        with FileUtils.for_writing(f"{task_checkpoint}/labels") as file:
-            for label in labels:
-                file.write(f"{label}\n")
-        
-        with FileUtils.for_writing(f"{task_checkpoint}/weights") as file:
-            file.write(f"# {numpy_weights.shape[0]} {numpy_weights.shape[1]}\n")
-            for x in numpy_weights:
-                for y in x:
-                    file.write(f"{y} ")
-                file.write("\n")
-        
-        with FileUtils.for_writing(f"{task_checkpoint}/biases") as file:
-            file.write(f"# {numpy_bias.shape[0]}\n")
-            for x in numpy_bias:
-                file.write(f"{x} ")
-            file.write("\n")
+
+        if binary:
+            HeadFormat.write_binary(f"{task_checkpoint}/{HeadFormat.binary_name}", task.task_name, task.dual_mode, numpy_weights, numpy_bias, labels)
+        else:
+            HeadFormat.write_text(task_checkpoint, numpy_weights, numpy_bias, labels)
     
     def export_name(self, file_name: str, name: str) -> None:
         with open(file_name, "w", encoding=Parameters.encoding) as file:
@@ -198,11 +296,26 @@ class TokenClassificationModel(PreTrainedModel):
             input_names = input_names,
             output_names = output_names,
             opset_version=13, # see: https://chadrick-kwag.net/error-fix-onnxruntime-type-error-type-tensorint64-of-input-parameter-of-operatormin-in-node-is-invalid/
-            dynamic_axes = {"token_ids": {1: "sent length"}}
+            dynamic_axes = {"token_ids": {1: "sent length"}},
+            **OnnxExport.get_export_options()
         )
 
     # exports model in a format friendly for ingestion on the JVM
-    def export_model(self, tasks: List[Task], tokenizer: AutoTokenizer, checkpoint_dir: str) -> None:
+    # if binary_heads, each head is written as a single HeadFormat file, which only the Python readers understand so far
+    # if dynamic_batch, the encoder takes padded batches along with their attention mask and is checked against PyTorch
+    # if single_graph, the encoder and all heads are additionally exported together, also with dynamic batches
+    # if quantize, an INT8 copy of the encoder is added unless it loses too much dev accuracy compared to this model, in which case this raises
+    # the options that are None are taken from Parameters when this is called
+    def export_model(self,
+        tasks: List[Task], tokenizer: AutoTokenizer, checkpoint_dir: str, binary_heads: Optional[bool] = None,
+        dynamic_batch: Optional[bool] = None, single_graph: Optional[bool] = None,
+        single_graph_labels: Optional[bool] = None, quantize: Optional[bool] = None
+    ) -> None:
+        binary_heads = Parameters.export_binary_heads if binary_heads is None else binary_heads
+        dynamic_batch = Parameters.export_dynamic_batch if dynamic_batch is None else dynamic_batch
+        single_graph = Parameters.export_single_graph if single_graph is None else single_graph
+        single_graph_labels = Parameters.export_single_graph_labels if single_graph_labels is None else single_graph_labels
+        quantize = Parameters.export_quantized if quantize is None else quantize
         # send the entire model to CPU for this export
         export_device = "cpu"
         self.to(export_device)
@@ -210,15 +323,32 @@ class TokenClassificationModel(PreTrainedModel):
         # save the weights/bias in each linear layer
         task_folder = f"{checkpoint_dir}/tasks"
         os.makedirs(task_folder, exist_ok = True)
-        for index, task in enumerate(tasks):
-            task_checkpoint = f"{task_folder}/{index}"
-            self.export_task(self.output_heads[str(task.task_id)], task, task_checkpoint)
+        with CluProfiler.span("export_heads"):
+            for index, task in enumerate(tasks):
+                task_checkpoint = f"{task_folder}/{index}"
+                self.export_task(self.output_heads[str(task.task_id)], task, task_checkpoint, binary_heads)
     
         # save the encoder as an ONNX model
         onnx_checkpoint = f"{checkpoint_dir}/encoder.onnx"
-        self.export_encoder(onnx_checkpoint, tokenizer, export_device)
+        with CluProfiler.span("export_encoder", dynamic_batch=dynamic_batch):
+            if dynamic_batch:
+                OnnxExport.export_encoder(self.encoder, tokenizer, onnx_checkpoint, export_device)
+                OnnxExport.check_encoder(self.encoder, onnx_checkpoint)
+            else:
+                self.export_encoder(onnx_checkpoint, tokenizer, export_device)
+        if single_graph:
+            model_checkpoint = f"{checkpoint_dir}/model.onnx"
+            with CluProfiler.span("export_single_graph"):
+                OnnxExport.export_model(self, tasks, tokenizer, model_checkpoint, export_device, single_graph_labels)
+                OnnxExport.check_model(self, tasks, model_checkpoint, single_graph_labels)
         self.export_name(f"{checkpoint_dir}/encoder.name", Parameters.transformer_name)
         self.export_maxtokens(f"{checkpoint_dir}/encoder.maxtokens", self.config.max_position_embeddings)
+        # this comes last, so that a failed accuracy check still leaves a complete export without the INT8 copy
+        if quantize:
+            # imported here because the quantizer evaluates with the Evaluator, which depends on this module
+            from onnx_quantizer import OnnxQuantizer
+            with CluProfiler.span("export_quantized"):
+                OnnxQuantizer.quantize_and_check(onnx_checkpoint, self, tasks)
         
 
 class TokenClassificationHead(nn.Module):
@@ -0,0 +1,115 @@
+import json
+import os
+
+from names import Names
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from transformers import PreTrainedTokenizerFast
+
+# Loads each fast tokenizer at most once per process.  Tokenizers that are bundled with the tokenizer subproject
+# are built directly from their tokenizer.json, so they need no access to the Hugging Face hub, and all others
+# are loaded from the hub, or from its cache, as before.  That includes the default one, microsoft/deberta-v3-base,
+# so offline it must have been cached already.  The tokenizers are shared, so callers must not modify them.
+class TokenizerRegistry:
+    resource_dir = os.path.normpath(os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "../../../../tokenizer/src/main/resources/org/clulab/scala_transformers/tokenizer"
+    ))
+    model_input_names = [Names.INPUT_IDS, "token_type_ids", "attention_mask"]
+    # tokenizer.json does not record the maximum length, but this is the one of all the bundled tokenizers
+    model_max_length = 512
+    # the special tokens of the bundled tokenizers and the roles that they play
+    special_token_roles = {
+        "[PAD]": ["pad_token"], "<pad>": ["pad_token"],
+        "[UNK]": ["unk_token"], "<unk>": ["unk_token"],
+        "[CLS]": ["cls_token"], "<s>": ["bos_token", "cls_token"],
+        "[SEP]": ["sep_token"], "</s>": ["eos_token", "sep_token"],
+        "[MASK]": ["mask_token"], "<mask>": ["mask_token"]
+    }
+    tokenizers: Dict[Tuple[str, bool], "PreTrainedTokenizerFast"] = {}
+
+    # add_prefix_space is needed only for the roberta tokenizer
+    @classmethod
+    def get_add_prefix_space(cls, name: str) -> bool:
+        return "roberta" in name.lower()
+
+    @classmethod
+    def get_file_name(cls, name: str) -> str:
+        return f"{cls.resource_dir}/{name}/tokenizer.json"
+
+    @classmethod
+    def is_bundled(cls, name: str) -> bool:
+        return os.path.exists(cls.get_file_name(name))
+
+    @classmethod
+    def get_bundled_names(cls) -> List[str]:
+        return sorted(
+            os.path.relpath(dir_name, cls.resource_dir).replace(os.sep, "/")
+            for dir_name, _, file_names in os.walk(cls.resource_dir) if "tokenizer.json" in file_names
+        )
+
+    # as with the Hugging Face libraries, either variable turns off access to the hub
+    @classmethod
+    def is_offline(cls) -> bool:
+        return any(os.environ.get(variable, "0").upper() in ["1", "ON", "YES", "TRUE"] for variable in ["HF_HUB_OFFLINE", "TRANSFORMERS_OFFLINE"])
+
+    # whether the tokenizer can be loaded without the hub being consulted, which only counts when offline
+    @classmethod
+    def is_available(cls, name: str) -> bool:
+        return cls.is_bundled(name) or not cls.is_offline()
+
+    @classmethod
+    def get_special_tokens(cls, added_tokens: List[Dict[str, Any]]) -> Dict[str, str]:
+        special_tokens = {}
+        for added_token in added_tokens:
+            if added_token.get("special", False):
+                for role in cls.special_token_roles.get(added_token["content"], []):
+                    special_tokens[role] = added_token["content"]
+        return special_tokens
+
+    # the add_prefix_space of the ByteLevel pre-tokenizer and post-processor, if there are any, is set as requested
+    @classmethod
+    def set_add_prefix_space(cls, tokenizer_json: Dict[str, Any], add_prefix_space: bool) -> None:
+        for component in [tokenizer_json.get("pre_tokenizer"), tokenizer_json.get("post_processor")]:
+            if component is not None and "add_prefix_space" in component:
+                component["add_prefix_space"] = add_prefix_space
+
+    @classmethod
+    def load_bundled(cls, name: str, add_prefix_space: bool) -> "PreTrainedTokenizerFast":
+        from tokenizers import Tokenizer
+        from transformers import PreTrainedTokenizerFast
+
+        with open(cls.get_file_name(name), "r", encoding="UTF-8") as file:
+            tokenizer_json = json.load(file)
+        cls.set_add_prefix_space(tokenizer_json, add_prefix_space)
+        return PreTrainedTokenizerFast(
+            tokenizer_object=Tokenizer.from_str(json.dumps(tokenizer_json)),
+            name_or_path=name,
+            model_input_names=cls.model_input_names,
+            model_max_length=cls.model_max_length,
+            **cls.get_special_tokens(tokenizer_json["added_tokens"])
+        )
+
+    @classmethod
+    def load_pretrained(cls, name: str, add_prefix_space: bool) -> "PreTrainedTokenizerFast":
+        from transformers import AutoTokenizer
+
+        try:
+            return AutoTokenizer.from_pretrained(name, model_input_names=cls.model_input_names, add_prefix_space=add_prefix_space)
+        except OSError as error:
+            raise Exception(
+                f"The tokenizer named \"{name}\" is not bundled and could not be loaded from the Hugging Face hub or its cache.  " +
+                f"Either load it once while online so that it is cached, or use one of the bundled tokenizers: {', '.join(cls.get_bundled_names())}."
+            ) from error
+
+    @classmethod
+    def get(cls, name: str, add_prefix_space: Optional[bool] = None) -> "PreTrainedTokenizerFast":
+        if add_prefix_space is None:
+            add_prefix_space = cls.get_add_prefix_space(name)
+        key = (name, add_prefix_space)
+        if key not in cls.tokenizers:
+            bundled = cls.is_bundled(name)
+            print(f"Loading {'bundled' if bundled else 'pretrained'} tokenizer named \"{name}\" with add_prefix_space={add_prefix_space}...")
+            cls.tokenizers[key] = cls.load_bundled(name, add_prefix_space) if bundled else cls.load_pretrained(name, add_prefix_space)
+        return cls.tokenizers[key]
@@ -0,0 +1,132 @@
+import json
+
+from collections import OrderedDict
+from clu_profiler import CluProfiler
+from names import Names
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from transformers import AutoTokenizer
+
+# Remembers the subword ids of recently seen words so that sentences that are split into words can be tokenized
+# by concatenating the ids of their words and adding the special tokens around them.  The corpora repeat the same
+# words over and over, so most words never reach the tokenizer.  This is only done for tokenizers whose output is
+# known to be the same: WordPiece models with the BERT normalizer and pre-tokenizer, neither of which looks beyond
+# a single word, and a post-processor that only adds special tokens before and after the sentence.  Tokenizers
+# whose output for a word depends on its position, like the ByteLevel BPE of roberta with add_prefix_space or the
+# Metaspace of sentencepiece models, are rejected by mk(), and callers should use the tokenizer itself for them.
+# Up to max_size words are kept, and the least recently used one is forgotten when there are more.
+class WordPieceCache:
+    normalizer_types = {None, "BertNormalizer"}
+    pre_tokenizer_types = {"BertPreTokenizer"}
+    caches: Dict[int, Tuple["AutoTokenizer", Optional["WordPieceCache"]]] = {}
+
+    def __init__(self, tokenizer: "AutoTokenizer", prefix_ids: List[int], suffix_ids: List[int], max_size: int) -> None:
+        self.tokenizer = tokenizer
+        self.prefix_ids = prefix_ids
+        self.suffix_ids = suffix_ids
+        self.max_size = max_size
+        self.word_pieces: "OrderedDict[str, List[int]]" = OrderedDict()
+
+    @classmethod
+    def get_type(cls, component: Optional[Dict[str, Any]]) -> Optional[str]:
+        return component["type"] if component is not None else None
+
+    # the ids of the special tokens that the post-processor puts before and after a single sentence, if that is all it does
+    @classmethod
+    def get_special_ids(cls, post_processor: Optional[Dict[str, Any]]) -> Optional[Tuple[List[int], List[int]]]:
+        post_processor_type = cls.get_type(post_processor)
+        if post_processor_type is None:
+            return [], []
+        assert post_processor is not None
+        if post_processor_type == "BertProcessing":
+            return [post_processor["cls"][1]], [post_processor["sep"][1]]
+        if post_processor_type == "TemplateProcessing":
+            special_ids: Tuple[List[int], List[int]] = ([], [])
+            sequences = 0
+            for piece in post_processor["single"]:
+                if "Sequence" in piece:
+                    sequences += 1
+                else:
+                    special_ids[min(sequences, 1)].extend(post_processor["special_tokens"][piece["SpecialToken"]["id"]]["ids"])
+            return special_ids if sequences == 1 else None
+        return None
+
+    # returns None, along with the reason, if the tokenizer does not qualify
+    @classmethod
+    def check(cls, tokenizer: "AutoTokenizer") -> Tuple[Optional[Tuple[List[int], List[int]]], str]:
+        if not tokenizer.is_fast:
+            return None, "it is not a fast tokenizer"
+        tokenizer_json = json.loads(tokenizer.backend_tokenizer.to_str())
+        model_type = tokenizer_json["model"]["type"]
+        if model_type != "WordPiece":
+            return None, f"its model is {model_type} rather than WordPiece"
+        normalizer_type = cls.get_type(tokenizer_json["normalizer"])
+        if normalizer_type not in cls.normalizer_types:
+            return None, f"its normalizer is {normalizer_type}"
+        pre_tokenizer_type = cls.get_type(tokenizer_json["pre_tokenizer"])
+        if pre_tokenizer_type not in cls.pre_tokenizer_types:
+            return None, f"its pre-tokenizer is {pre_tokenizer_type}"
+        special_ids = cls.get_special_ids(tokenizer_json["post_processor"])
+        if special_ids is None:
+            return None, f"its post-processor {cls.get_type(tokenizer_json['post_processor'])} does more than add special tokens"
+        return special_ids, ""
+
+    # returns None if the tokenizer must be used instead of the cache
+    @classmethod
+    def mk(cls, tokenizer: "AutoTokenizer", max_size: int) -> Optional["WordPieceCache"]:
+        special_ids, reason = cls.check(tokenizer)
+        if special_ids is None:
+            print(f"Not caching the word pieces of the tokenizer named \"{tokenizer.name_or_path}\" because {reason}.")
+            return None
+        return WordPieceCache(tokenizer, special_ids[0], special_ids[1], max_size)
+
+    # like mk(), but the cache of each tokenizer is made only once and is then shared by all tasks
+    @classmethod
+    def get(cls, tokenizer: "AutoTokenizer", max_size: int) -> Optional["WordPieceCache"]:
+        key = id(tokenizer)
+        if key not in cls.caches or cls.caches[key][0] is not tokenizer:
+            cls.caches[key] = (tokenizer, cls.mk(tokenizer, max_size))
+        return cls.caches[key][1]
+
+    # the word pieces of the given words; words that are not cached are tokenized together and then cached
+    def get_word_pieces(self, words: List[str]) -> Dict[str, List[int]]:
+        word_pieces = {}
+        missing_words = []
+        for word in dict.fromkeys(words):
+            pieces = self.word_pieces.get(word)
+            if pieces is not None:
+                self.word_pieces.move_to_end(word)
+                word_pieces[word] = pieces
+            else:
+                missing_words.append(word)
+        CluProfiler.count("word_piece_cache_hits", len(word_pieces))
+        CluProfiler.count("word_piece_cache_misses", len(missing_words))
+        if missing_words:
+            all_ids = self.tokenizer([[word] for word in missing_words], is_split_into_words=True, add_special_tokens=False)[Names.INPUT_IDS]
+            for word, ids in zip(missing_words, all_ids):
+                word_pieces[word] = ids
+                self.word_pieces[word] = ids
+            while len(self.word_pieces) > self.max_size:
+                self.word_pieces.popitem(last=False)
+        return word_pieces
+
+    # the equivalent of the input_ids and word_ids() of tokenizer(sentences, is_split_into_words=True)
+    def tokenize(self, sentences: List[List[str]]) -> Tuple[List[List[int]], List[List[Optional[int]]]]:
+        word_pieces = self.get_word_pieces([word for words in sentences for word in words])
+        prefix_word_ids: List[Optional[int]] = [None] * len(self.prefix_ids)
+        suffix_word_ids: List[Optional[int]] = [None] * len(self.suffix_ids)
+        input_ids_batch = []
+        word_ids_batch = []
+        for words in sentences:
+            input_ids = list(self.prefix_ids)
+            word_ids = list(prefix_word_ids)
+            for word_id, word in enumerate(words):
+                pieces = word_pieces[word]
+                input_ids.extend(pieces)
+                word_ids.extend([word_id] * len(pieces))
+            input_ids.extend(self.suffix_ids)
+            word_ids.extend(suffix_word_ids)
+            input_ids_batch.append(input_ids)
+            word_ids_batch.append(word_ids)
+        return input_ids_batch, word_ids_batch